@@ -6,7 +6,11 @@ import { useStreamContext } from "@/providers/Stream";
 import { useState, FormEvent } from "react";
 import { Button } from "../ui/button";
 import { Checkpoint, Message } from "@langchain/langgraph-sdk";
-import { AssistantMessage, AssistantMessageLoading } from "./messages/ai";
+import {
+  AssistantMessage,
+  AssistantMessageLoading,
+  ToolProgressIndicator,
+} from "./messages/ai";
 import { HumanMessage } from "./messages/human";
 import {
   DO_NOT_RENDER_ID_PREFIX,
@@ -245,6 +249,8 @@ export function Thread() {
       { messages: [...toolMessages, newHumanMessage], context },
       {
         streamMode: ["values"],
+        // Cancel the run when the page is closed so abandoned tool work stops.
+        onDisconnect: "cancel",
         optimisticValues: (prev) => ({
           ...prev,
           context,
@@ -270,6 +276,7 @@ export function Thread() {
     stream.submit(undefined, {
       checkpoint: parentCheckpoint,
       streamMode: ["values"],
+      onDisconnect: "cancel",
     });
   };
 
@@ -453,6 +460,9 @@ export function Thread() {
                   {isLoading && !firstTokenReceived && (
                     <AssistantMessageLoading />
                   )}
+                  {isLoading && stream.toolProgress && (
+                    <ToolProgressIndicator progress={stream.toolProgress} />
+                  )}
                 </>
               }
               footer={
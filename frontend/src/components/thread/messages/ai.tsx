@@ -1,5 +1,5 @@
 import { parsePartialJson } from "@langchain/core/output_parsers";
-import { useStreamContext } from "@/providers/Stream";
+import { useStreamContext, type ToolProgressEvent } from "@/providers/Stream";
 import { AIMessage, Checkpoint, Message } from "@langchain/langgraph-sdk";
 import { getContentString } from "../utils";
 import { BranchSwitcher, CommandBar } from "./shared";
@@ -211,6 +211,22 @@ export function AssistantMessage({
   );
 }
 
+export function ToolProgressIndicator({
+  progress,
+}: {
+  progress: ToolProgressEvent;
+}) {
+  return (
+    <div className="mr-auto flex items-start gap-2">
+      <div className="bg-muted text-muted-foreground flex h-8 items-center gap-2 rounded-2xl px-4 py-2 text-sm">
+        <div className="bg-foreground/50 h-1.5 w-1.5 animate-[pulse_1.5s_ease-in-out_infinite] rounded-full"></div>
+        <code className="text-foreground">{progress.tool}</code>
+        <span>{progress.message}</span>
+      </div>
+    </div>
+  );
+}
+
 export function AssistantMessageLoading() {
   return (
     <div className="mr-auto flex items-start gap-2">
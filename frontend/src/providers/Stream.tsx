@@ -27,6 +27,24 @@ import { toast } from "sonner";
 
 export type StateType = { messages: Message[]; ui?: UIMessage[] };
 
+// Progress event emitted by long-running tools through the custom stream.
+export type ToolProgressEvent = {
+  type: "tool_progress";
+  tool: string;
+  phase: string;
+  message: string;
+  elapsed: number;
+  [key: string]: unknown;
+};
+
+function isToolProgressEvent(event: unknown): event is ToolProgressEvent {
+  return (
+    typeof event === "object" &&
+    event !== null &&
+    (event as { type?: unknown }).type === "tool_progress"
+  );
+}
+
 const useTypedStream = useStream<
   StateType,
   {
@@ -35,11 +53,13 @@ const useTypedStream = useStream<
       ui?: (UIMessage | RemoveUIMessage)[] | UIMessage | RemoveUIMessage;
       context?: Record<string, unknown>;
     };
-    CustomEventType: UIMessage | RemoveUIMessage;
+    CustomEventType: UIMessage | RemoveUIMessage | ToolProgressEvent;
   }
 >;
 
-type StreamContextType = ReturnType<typeof useTypedStream>;
+type StreamContextType = ReturnType<typeof useTypedStream> & {
+  toolProgress: ToolProgressEvent | null;
+};
 const StreamContext = createContext<StreamContextType | undefined>(undefined);
 
 async function sleep(ms = 4000) {
@@ -79,12 +99,19 @@ const StreamSession = ({
 }) => {
   const [threadId, setThreadId] = useQueryState("threadId");
   const { getThreads, setThreads } = useThreads();
+  const [toolProgress, setToolProgress] = useState<ToolProgressEvent | null>(
+    null,
+  );
   const streamValue = useTypedStream({
     apiUrl,
     apiKey: apiKey ?? undefined,
     assistantId,
     threadId: threadId ?? null,
     onCustomEvent: (event, options) => {
+      if (isToolProgressEvent(event)) {
+        setToolProgress(event.phase === "done" ? null : event);
+        return;
+      }
       if (isUIMessage(event) || isRemoveUIMessage(event)) {
         options.mutate((prev) => {
           const ui = uiMessageReducer(prev.ui ?? [], event);
@@ -100,6 +127,10 @@ const StreamSession = ({
     },
   });
 
+  useEffect(() => {
+    if (!streamValue.isLoading) setToolProgress(null);
+  }, [streamValue.isLoading]);
+
   useEffect(() => {
     checkGraphStatus(apiUrl, apiKey).then((ok) => {
       if (!ok) {
@@ -119,7 +150,7 @@ const StreamSession = ({
   }, [apiKey, apiUrl]);
 
   return (
-    <StreamContext.Provider value={streamValue}>
+    <StreamContext.Provider value={{ ...streamValue, toolProgress }}>
       {children}
     </StreamContext.Provider>
   );
@@ -1,5 +1,191 @@
-def main():
-    print("Hello from data-agent!")
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+
+
+def load_prompts(path: str) -> list:
+    """
+    读取批处理输入，每行一个JSON对象：{"id": ..., "prompt": ..., "stub_tool_calls": [...]}，
+    也可以直接是一个JSON字符串。未提供 id 时使用行号。
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"prompt": record}
+            record.setdefault("id", str(line_no))
+            records.append(record)
+    return records
+
+
+def warm_up(graph_module, db_pool_size: int) -> dict:
+    """预热所有运行共享的资源，返回各项耗时（秒）。"""
+    from src.agents.db import configure_pool
+    from src.agents.schema_catalog import schema_catalog
+    from src.agents.tool_cache import tool_cache
+
+    timings = {}
+    start = time.perf_counter()
+    graph_module.warm_up_render_worker()
+    timings["render_worker"] = round(time.perf_counter() - start, 4)
+
+    start = time.perf_counter()
+    tool_cache.warm_up()
+    timings["tool_cache"] = round(time.perf_counter() - start, 4)
+
+    if os.getenv("HOST"):
+        start = time.perf_counter()
+        configure_pool(db_pool_size)
+        schema_catalog.get()
+        timings["db_pool_and_schema"] = round(time.perf_counter() - start, 4)
+    return timings
+
+
+async def run_one(graph, record: dict, semaphore: asyncio.Semaphore, timeout: float,
+                  recursion_limit: int, write_result) -> dict:
+    """运行单条分析请求，记录每个图节点的耗时与工具调用。"""
+    from langchain_core.messages import AIMessage, HumanMessage
+    from src.agents.progress import PROGRESS_EVENT_TYPE, cancel_thread
+
+    async with semaphore:
+        thread_id = f"batch-{record['id']}-{uuid.uuid4().hex[:8]}"
+        config = {"configurable": {"thread_id": thread_id}, "recursion_limit": recursion_limit}
+        additional_kwargs = {"stub_tool_calls": record["stub_tool_calls"]} if record.get("stub_tool_calls") else {}
+        message = HumanMessage(content=record["prompt"], additional_kwargs=additional_kwargs)
+
+        steps = []
+        answer = ""
+        last_progress = None
+        started = time.perf_counter()
+        last = started
+
+        async def consume():
+            nonlocal answer, last, last_progress
+            async for mode, chunk in graph.astream({"messages": [message]}, config, stream_mode=["updates", "custom"]):
+                if mode == "custom":
+                    if isinstance(chunk, dict) and chunk.get("type") == PROGRESS_EVENT_TYPE:
+                        last_progress = chunk
+                    continue
+                now = time.perf_counter()
+                for node, update in chunk.items():
+                    update = update or {}
+                    messages = update.get("messages", [])
+                    step = {"node": node, "seconds": round(now - last, 4)}
+                    tool_calls = [call["name"] for m in messages for call in (getattr(m, "tool_calls", None) or [])]
+                    if tool_calls:
+                        step["tool_calls"] = tool_calls
+                    if node == "tools":
+                        step["tools"] = [m.name for m in messages]
+                    if update.get("context_stats"):
+                        step["tokens_saved"] = update["context_stats"].get("tokens_saved", 0)
+                    steps.append(step)
+                    for m in messages:
+                        if isinstance(m, AIMessage) and not m.tool_calls:
+                            answer = m.content
+                last = now
+
+        status, error = "ok", ""
+        try:
+            await asyncio.wait_for(consume(), timeout=timeout)
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"超过 {timeout} 秒未完成"
+            # 通知仍在线程中执行的工具在下一个检查点退出
+            cancel_thread(thread_id)
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+
+        result = {
+            "id": record["id"],
+            "thread_id": thread_id,
+            "prompt": record["prompt"],
+            "status": status,
+            "answer": answer,
+            "error": error,
+            "total_seconds": round(time.perf_counter() - started, 4),
+            "steps": steps,
+            "last_progress": last_progress,
+        }
+        await write_result(result)
+        return result
+
+
+async def run_batch(args) -> list:
+    from dotenv import load_dotenv
+    # 会话存储、工具缓存、上传索引等在导入时读取配置，需在导入图模块前加载 .env
+    load_dotenv(override=True)
+    if args.stub_model:
+        # 离线模式：模块导入时会创建在线模型与搜索客户端，为其提供占位密钥，实际推理全部使用本地模型
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        os.environ.setdefault("TAVILY_API_KEY", "stub")
+    from src.agents import graph as graph_module
+    from src.agents.checkpoint import aget_checkpointer
+
+    if args.stub_model:
+        from src.agents.stub_model import StubChatModel
+        model = StubChatModel(latency=args.stub_latency)
+    else:
+        model = graph_module.model
+
+    timings = warm_up(graph_module, args.db_pool_size or args.concurrency)
+    print(f"资源预热完成：{timings}", file=sys.stderr)
+
+    records = load_prompts(args.input)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    write_lock = asyncio.Lock()
+
+    # graph_module.graph 使用同步检查点保存器，astream 需要异步版本，因此单独创建批处理用的图
+    async with aget_checkpointer() as checkpointer:
+        graph = graph_module.build_graph(model, checkpointer=checkpointer)
+        with open(args.output, "w", encoding="utf-8") as out:
+            async def write_result(result: dict):
+                async with write_lock:
+                    out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                    out.flush()
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*[
+                run_one(graph, record, semaphore, args.timeout, args.recursion_limit, write_result)
+                for record in records
+            ])
+            elapsed = time.perf_counter() - started
+
+    durations = sorted(r["total_seconds"] for r in results)
+    statuses = {s: sum(1 for r in results if r["status"] == s) for s in ("ok", "timeout", "error")}
+    if durations:
+        p50 = durations[len(durations) // 2]
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        print(f"完成 {len(results)} 条请求，用时 {elapsed:.2f} 秒，吞吐 {len(results) / elapsed:.2f} 条/秒，"
+              f"P50 {p50:.2f} 秒，P95 {p95:.2f} 秒，状态：{statuses}", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Data Agent 命令行工具")
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch = subparsers.add_parser("batch", help="批量运行JSONL中的分析请求")
+    batch.add_argument("input", help="输入JSONL文件，每行一个请求")
+    batch.add_argument("-o", "--output", default="batch_results.jsonl", help="输出JSONL文件")
+    batch.add_argument("-c", "--concurrency", type=int, default=4, help="最大并发请求数")
+    batch.add_argument("--timeout", type=float, default=300, help="单条请求超时时间（秒）")
+    batch.add_argument("--recursion-limit", type=int, default=25, help="单条请求的最大图步数")
+    batch.add_argument("--db-pool-size", type=int, default=0, help="数据库连接池大小，默认与并发数相同")
+    batch.add_argument("--stub-model", action="store_true", help="使用本地模拟模型，离线运行基准测试")
+    batch.add_argument("--stub-latency", type=float, default=0.0, help="模拟模型每次调用的延迟（秒）")
+
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        asyncio.run(run_batch(args))
+    else:
+        parser.print_help()
 
 
 if __name__ == "__main__":
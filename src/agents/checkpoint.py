@@ -0,0 +1,71 @@
+import os
+from contextlib import asynccontextmanager
+
+
+def get_checkpointer():
+    """
+    根据环境变量 CHECKPOINTER 创建检查点保存器：sqlite、postgres、mongodb。
+    未配置时返回 None，由 LangGraph 服务（langgraph dev / LangGraph Platform）自行管理持久化。
+    CHECKPOINT_URI 为对应的数据库文件路径或连接串。
+    """
+    backend = os.getenv("CHECKPOINTER", "").strip().lower()
+    uri = os.getenv("CHECKPOINT_URI", "")
+    if not backend:
+        return None
+
+    if backend == "sqlite":
+        import sqlite3
+        from langgraph.checkpoint.sqlite import SqliteSaver
+        conn = sqlite3.connect(uri or os.path.join(os.getcwd(), "checkpoints.sqlite"), check_same_thread=False)
+        return SqliteSaver(conn)
+
+    if backend == "postgres":
+        from psycopg import Connection
+        from psycopg.rows import dict_row
+        from langgraph.checkpoint.postgres import PostgresSaver
+        conn = Connection.connect(uri, autocommit=True, prepare_threshold=0, row_factory=dict_row)
+        checkpointer = PostgresSaver(conn)
+        checkpointer.setup()
+        return checkpointer
+
+    if backend == "mongodb":
+        from pymongo import MongoClient
+        from langgraph.checkpoint.mongodb import MongoDBSaver
+        return MongoDBSaver(MongoClient(uri))
+
+    raise ValueError(f"不支持的 CHECKPOINTER：{backend}，可选：sqlite, postgres, mongodb")
+
+
+@asynccontextmanager
+async def aget_checkpointer():
+    """
+    get_checkpointer 的异步版本，供 astream/ainvoke 使用（同步保存器不支持异步调用）。
+    用法：async with aget_checkpointer() as checkpointer: ...，退出时关闭数据库连接。
+    未配置时得到 None。
+    """
+    backend = os.getenv("CHECKPOINTER", "").strip().lower()
+    uri = os.getenv("CHECKPOINT_URI", "")
+    if not backend:
+        yield None
+        return
+
+    if backend == "sqlite":
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        async with AsyncSqliteSaver.from_conn_string(uri or os.path.join(os.getcwd(), "checkpoints.sqlite")) as checkpointer:
+            yield checkpointer
+        return
+
+    if backend == "postgres":
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+        async with AsyncPostgresSaver.from_conn_string(uri) as checkpointer:
+            await checkpointer.setup()
+            yield checkpointer
+        return
+
+    if backend == "mongodb":
+        from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
+        async with AsyncMongoDBSaver.from_conn_string(uri) as checkpointer:
+            yield checkpointer
+        return
+
+    raise ValueError(f"不支持的 CHECKPOINTER：{backend}，可选：sqlite, postgres, mongodb")
@@ -0,0 +1,200 @@
+import os
+import numpy as np
+import pandas as pd
+import pymysql
+from pymysql.constants import FIELD_TYPE
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow 为可选依赖，缺失时使用 NumPy 解码
+    pa = None
+
+# 根据游标返回的列类型元数据确定解码方式
+_FIELD_KINDS = {
+    FIELD_TYPE.TINY: "int", FIELD_TYPE.SHORT: "int", FIELD_TYPE.LONG: "int",
+    FIELD_TYPE.LONGLONG: "int", FIELD_TYPE.INT24: "int", FIELD_TYPE.YEAR: "int",
+    FIELD_TYPE.FLOAT: "float", FIELD_TYPE.DOUBLE: "float",
+    FIELD_TYPE.DECIMAL: "decimal", FIELD_TYPE.NEWDECIMAL: "decimal",
+    FIELD_TYPE.TIMESTAMP: "datetime", FIELD_TYPE.DATETIME: "datetime",
+    FIELD_TYPE.DATE: "date", FIELD_TYPE.NEWDATE: "date", FIELD_TYPE.TIME: "time",
+    FIELD_TYPE.VARCHAR: "string", FIELD_TYPE.VAR_STRING: "string", FIELD_TYPE.STRING: "string",
+    FIELD_TYPE.ENUM: "string", FIELD_TYPE.SET: "string", FIELD_TYPE.JSON: "string",
+}
+
+DTYPE_BACKENDS = ("numpy", "numpy_nullable", "pyarrow")
+
+
+def _arrow_type(kind: str):
+    return {
+        "int": pa.int64(), "float": pa.float64(), "datetime": pa.timestamp("us"),
+        "date": pa.date32(), "time": pa.duration("us"), "string": pa.string(),
+    }.get(kind)
+
+
+def _to_arrow(values: tuple, kind: str):
+    """将一批单列值解码为 Arrow 数组；按元数据类型转换失败时退回类型推断。"""
+    if kind == "decimal":
+        # 与 pd.read_sql 的 coerce_float 行为一致，DECIMAL 转为 float64
+        try:
+            return pa.array(values).cast(pa.float64())
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            return pa.array([None if v is None else float(v) for v in values], type=pa.float64())
+    try:
+        return pa.array(values, type=_arrow_type(kind))
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return _infer_arrow(values, kind)
+
+
+def _infer_arrow(values, kind: str):
+    """
+    按元数据类型无法转换时的退回：整数先尝试 uint64（无符号 BIGINT 超出 int64），
+    再按值推断类型（如二进制排序规则返回 bytes）；仍失败时（如 '0000-00-00 00:00:00' 零日期
+    与正常日期混合）转为字符串列，与 pd.read_sql 一样保留原值而不是报错。
+    """
+    if kind == "int":
+        try:
+            return pa.array(values, type=pa.uint64())
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            pass
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def _empty_arrow(kind: str):
+    arrow_type = pa.float64() if kind == "decimal" else _arrow_type(kind)
+    return pa.array([], type=arrow_type or pa.null())
+
+
+def _unify_chunks(chunks: list, kind: str) -> list:
+    """不同批次推断出的类型不一致时（如某批全为空值），统一为首个非空类型。"""
+    if len({c.type for c in chunks}) <= 1:
+        return chunks
+    target = next((c.type for c in chunks if c.type != pa.null()), pa.null())
+    try:
+        return [c.cast(target) for c in chunks]
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return [_infer_arrow([v for c in chunks for v in c.to_pylist()], kind)]
+
+
+def _to_numpy(values: tuple, kind: str):
+    """不依赖 pyarrow 时，将一批单列值解码为类型化的 NumPy 数组。"""
+    count = len(values)
+    if kind == "int":
+        if None not in values:
+            try:
+                return np.fromiter(values, dtype=np.int64, count=count)
+            except OverflowError:
+                return np.array(values, dtype=object)
+        return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=count)
+    if kind in ("float", "decimal"):
+        return np.fromiter((np.nan if v is None else float(v) for v in values), dtype=np.float64, count=count)
+    try:
+        if kind in ("datetime", "date"):
+            return pd.to_datetime(list(values)).to_numpy()
+        if kind == "time":
+            return pd.to_timedelta(list(values)).to_numpy()
+    except (ValueError, TypeError, OverflowError):
+        pass  # 零日期（'0000-00-00'）、超出范围的日期等保留原值
+    return np.array(values, dtype=object)
+
+
+def _concat_numpy(chunks: list):
+    if len(chunks) == 1:
+        return chunks[0]
+    # 整数列在部分批次中出现空值时，统一提升为 float64
+    if any(c.dtype == np.float64 for c in chunks) and all(c.dtype.kind in "if" for c in chunks):
+        return np.concatenate([c.astype(np.float64, copy=False) for c in chunks])
+    try:
+        return np.concatenate(chunks)
+    except (TypeError, ValueError):
+        return np.concatenate([c.astype(object) for c in chunks])
+
+
+def _nullable_types_mapper(arrow_type):
+    return {
+        pa.int64(): pd.Int64Dtype(), pa.uint64(): pd.UInt64Dtype(), pa.float64(): pd.Float64Dtype(),
+        pa.string(): pd.StringDtype(), pa.bool_(): pd.BooleanDtype(),
+    }.get(arrow_type)
+
+
+def get_dtype_backend() -> str:
+    """读取提取结果的数据类型后端：numpy（默认）、numpy_nullable 或 pyarrow。"""
+    backend = os.getenv("EXTRACT_DTYPE_BACKEND", "numpy").strip().lower()
+    return backend if backend in DTYPE_BACKENDS else "numpy"
+
+
+def _abort_connection(connection):
+    """中途放弃读取时直接断开连接，避免关闭无缓冲游标时先读完服务端剩余的全部结果。"""
+    try:
+        connection._force_close()
+    except Exception:
+        pass
+
+
+def read_sql_columnar(connection, sql: str, params=None, dtype_backend: str = "numpy",
+                      batch_size: int = 50000, progress=None) -> pd.DataFrame:
+    """
+    按列类型元数据将查询结果直接解码为类型化的列缓冲区，替代 pd.read_sql。
+    使用无缓冲游标分批读取，每批行元组在转为 Arrow/NumPy 列后立即释放，
+    不会生成 object 类型的中间 DataFrame，也不需要事后类型推断。
+    :param dtype_backend: numpy（NumPy 原生类型）、numpy_nullable（pandas 可空类型）、pyarrow（Arrow 支持的 DataFrame）
+    :param progress: 每读取一批后以累计行数调用；抛出异常即中止读取并断开连接
+    """
+    if dtype_backend not in DTYPE_BACKENDS:
+        raise ValueError(f"不支持的 dtype_backend：{dtype_backend}，可选：{', '.join(DTYPE_BACKENDS)}")
+    if dtype_backend == "pyarrow" and pa is None:
+        raise ImportError("dtype_backend='pyarrow' 需要安装pyarrow库。请运行：pip install pyarrow")
+
+    cursor = connection.cursor(pymysql.cursors.SSCursor)
+    streaming = False
+    try:
+        cursor.execute(sql, params)
+        streaming = True
+        names = [d[0] for d in cursor.description]
+        kinds = [_FIELD_KINDS.get(d[1], "other") for d in cursor.description]
+        chunks = [[] for _ in names]
+        rows_read = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for i, values in enumerate(zip(*rows)):
+                chunks[i].append(_to_arrow(values, kinds[i]) if pa is not None else _to_numpy(values, kinds[i]))
+            rows_read += len(rows)
+            del rows
+            if progress is not None:
+                progress(rows_read)
+        streaming = False
+    except BaseException:
+        if streaming:
+            _abort_connection(connection)
+        raise
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+    if pa is None:
+        # 按位置构建后再设置列名，保留SQL结果中可能出现的重复列名
+        data = {i: _concat_numpy(c) if c else _to_numpy((), kind) for i, (kind, c) in enumerate(zip(kinds, chunks))}
+        df = pd.DataFrame(data)
+        df.columns = names
+        if dtype_backend == "numpy_nullable":
+            df = df.convert_dtypes(dtype_backend="numpy_nullable")
+        return df
+
+    arrays = []
+    for kind, column_chunks in zip(kinds, chunks):
+        if not column_chunks:
+            column_chunks = [_empty_arrow(kind)]
+        arrays.append(pa.chunked_array(_unify_chunks(column_chunks, kind)))
+    table = pa.Table.from_arrays(arrays, names=names)
+
+    if dtype_backend == "pyarrow":
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    if dtype_backend == "numpy_nullable":
+        return table.to_pandas(types_mapper=_nullable_types_mapper, date_as_object=False)
+    return table.to_pandas(date_as_object=False)
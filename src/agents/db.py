@@ -0,0 +1,120 @@
+import os
+import queue
+import threading
+import pymysql
+from typing import Optional
+from dotenv import load_dotenv
+
+
+def _connect(**kwargs) -> pymysql.connections.Connection:
+    load_dotenv(override=True)
+    return pymysql.connect(
+        host=os.getenv('HOST'),
+        user=os.getenv('USER'),
+        passwd=os.getenv('MYSQL_PW'),
+        db=os.getenv('DB_NAME'),
+        port=int(os.getenv('PORT')),
+        charset='utf8',
+        **kwargs
+    )
+
+
+class ConnectionPool:
+    """
+    固定上限的MySQL连接池。连接取出时先 ping 检查可用性，
+    归还时回滚未提交事务，避免下一次使用读到旧的一致性快照。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self) -> pymysql.connections.Connection:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return _connect()
+                try:
+                    conn.ping(reconnect=True)
+                    return conn
+                except Exception:
+                    _close_quietly(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn: pymysql.connections.Connection):
+        try:
+            conn.rollback()
+            self._idle.put(conn)
+        except Exception:
+            _close_quietly(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                _close_quietly(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+class PooledConnection:
+    """连接池中连接的代理：close() 时归还连接池而不是断开。"""
+
+    def __init__(self, pool: ConnectionPool, conn: pymysql.connections.Connection):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(size: int):
+    """启用（size > 0）或关闭（size = 0）共享连接池，默认读取环境变量 DB_POOL_SIZE。"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(size) if size > 0 else None
+
+
+def get_connection(**kwargs):
+    """
+    根据环境变量创建MySQL连接（HOST、USER、MYSQL_PW、DB_NAME、PORT）。
+    启用连接池且未指定额外参数时，返回池化连接，调用 close() 即归还。
+    额外的关键字参数会透传给 pymysql.connect，例如 cursorclass。
+    """
+    global _pool
+    if _pool is None and not kwargs:
+        size = int(os.getenv("DB_POOL_SIZE", "0"))
+        if size > 0:
+            with _pool_lock:
+                if _pool is None:
+                    _pool = ConnectionPool(size)
+    if _pool is not None and not kwargs:
+        pool = _pool
+        return PooledConnection(pool, pool.acquire())
+    return _connect(**kwargs)
@@ -0,0 +1,153 @@
+import ast
+import math
+import re
+import numexpr
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+# numexpr 支持的函数白名单（sum/prod 只能作为最外层归约）
+NUMEXPR_FUNCTIONS = {
+    "sin", "cos", "tan", "arcsin", "arccos", "arctan", "arctan2", "sinh", "cosh", "tanh",
+    "arcsinh", "arccosh", "arctanh", "log", "log10", "log1p", "exp", "expm1", "sqrt", "abs",
+    "where", "ceil", "floor", "real", "imag", "complex", "conj", "sum", "prod",
+}
+# 在 NumPy 中预先计算、再作为变量交给 numexpr 的扩展函数
+_SHIFT_FUNCTION = "shift"
+_CONSTANTS = {"pi": math.pi, "e": math.e}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.USub, ast.UAdd,
+    ast.BitAnd, ast.BitOr, ast.Invert, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+_BACKTICK_RE = re.compile(r"`([^`]+)`")
+
+
+class ExpressionError(ValueError):
+    """表达式不符合安全语法或无法求值。"""
+
+
+def _column_array(series: pd.Series) -> np.ndarray:
+    """将列转换为 numexpr 可用的 NumPy 数组，可空类型的缺失值转为 NaN。"""
+    if pd.api.types.is_bool_dtype(series.dtype) and not series.hasnans:
+        return series.to_numpy(dtype=bool)
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        if pd.api.types.is_integer_dtype(series.dtype) and not series.hasnans:
+            return series.to_numpy(dtype=np.int64)
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    raise ExpressionError(f"列 `{series.name}` 的类型 {series.dtype} 不是数值类型，无法参与表达式计算")
+
+
+class _Validator(ast.NodeTransformer):
+    """校验表达式语法树，并将 shift(col, n) 替换为预先计算的变量。"""
+
+    def __init__(self):
+        self.names = set()
+        self.shifts = {}
+
+    def generic_visit(self, node):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ExpressionError(f"表达式中不允许使用 {type(node).__name__} 语法")
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float, bool)):
+            raise ExpressionError(f"不支持的常量：{node.value!r}")
+        return node
+
+    def visit_Compare(self, node):
+        if len(node.ops) > 1:
+            raise ExpressionError("不支持链式比较，请使用 (a < b) & (b < c)")
+        return self.generic_visit(node)
+
+    def visit_Name(self, node):
+        self.names.add(node.id)
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ExpressionError("函数调用只能使用白名单中的函数名和位置参数")
+        func = node.func.id
+        if func == _SHIFT_FUNCTION:
+            periods = _int_literal(node.args[1]) if len(node.args) == 2 else 1
+            if len(node.args) not in (1, 2) or not isinstance(node.args[0], ast.Name) or periods is None:
+                raise ExpressionError("shift 的用法为 shift(列名, 整数期数)")
+            placeholder = f"__shift_{len(self.shifts)}"
+            self.shifts[placeholder] = (node.args[0].id, periods)
+            self.names.add(node.args[0].id)
+            return ast.copy_location(ast.Name(id=placeholder, ctx=ast.Load()), node)
+        if func not in NUMEXPR_FUNCTIONS:
+            raise ExpressionError(f"不支持的函数：{func}。可用函数：{', '.join(sorted(NUMEXPR_FUNCTIONS | {_SHIFT_FUNCTION}))}")
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+def _int_literal(node) -> Optional[int]:
+    """整数字面量的值（-1 解析为一元负号加常量），其他节点返回 None。"""
+    sign = 1
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        sign, node = -1, node.operand
+    if isinstance(node, ast.Constant) and isinstance(node.value, int) and not isinstance(node.value, bool):
+        return sign * node.value
+    return None
+
+
+def expression_names(expression: str) -> set:
+    """表达式中引用的名称（不含反引号包裹的列名），用于预先加载已落盘的会话变量；语法错误时返回空集合。"""
+    try:
+        tree = ast.parse(_BACKTICK_RE.sub("0", expression.strip()), mode="eval")
+    except SyntaxError:
+        return set()
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+
+def evaluate_expression(expression: str, df: Optional[pd.DataFrame] = None, scalars: Optional[dict] = None):
+    """
+    使用 numexpr 对表达式进行向量化求值（多线程、分块计算，不产生中间临时数组）。
+    表达式中的名称依次解析为：DataFrame 的列（列名含空格等字符时用反引号包裹）、
+    scalars 中的数值变量、常量 pi / e。额外支持 shift(列名, n) 引用前 n 行的值，用于计算环比、增长率。
+    :return: NumPy 数组或标量
+    """
+    columns = {}
+    def _replace_backtick(match):
+        placeholder = f"__col_{len(columns)}"
+        columns[placeholder] = match.group(1)
+        return placeholder
+    source = _BACKTICK_RE.sub(_replace_backtick, expression.strip())
+
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"表达式语法错误：{e.msg}")
+    validator = _Validator()
+    tree = ast.fix_missing_locations(validator.visit(tree))
+
+    local_dict = {}
+    for name in validator.names:
+        column = columns.get(name, name)
+        if df is not None and column in df.columns:
+            local_dict[name] = _column_array(df[column])
+        elif scalars and isinstance(scalars.get(name), (int, float, np.number)) and not isinstance(scalars.get(name), bool):
+            local_dict[name] = scalars[name]
+        elif name in _CONSTANTS:
+            local_dict[name] = _CONSTANTS[name]
+        else:
+            raise ExpressionError(f"未知的名称：{column}。请确认列名或数值变量存在")
+    for placeholder, (name, periods) in validator.shifts.items():
+        if df is None or columns.get(name, name) not in df.columns:
+            raise ExpressionError(f"shift 只能用于 DataFrame 的列：{columns.get(name, name)} 不是列名")
+        values = np.asarray(local_dict[name], dtype=np.float64)
+        shifted = np.full_like(values, np.nan)
+        if 0 < periods < len(values):
+            shifted[periods:] = values[:-periods]
+        elif -len(values) < periods < 0:
+            shifted[:periods] = values[-periods:]
+        elif periods == 0:
+            shifted = values
+        local_dict[placeholder] = shifted
+
+    try:
+        return numexpr.evaluate(ast.unparse(tree), local_dict=local_dict, global_dict={})
+    except Exception as e:
+        raise ExpressionError(f"表达式求值失败：{e}")
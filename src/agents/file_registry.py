@@ -0,0 +1,281 @@
+import os
+import threading
+from typing import Dict, List, Optional
+from src.agents.tool_cache import file_fingerprint
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog 为可选依赖，缺失时使用目录 mtime 轮询
+    FileSystemEventHandler = object
+    Observer = None
+
+UPLOAD_PREFIX = "uploads"
+# 前端静态资源目录的候选位置（相对工作目录），按优先级排列
+_PUBLIC_DIRS = (os.path.join("frontend", "public"), "public", "")
+
+# 扩展名到 read_file 文件类型的映射
+FILE_TYPES = {
+    ".csv": "csv", ".xlsx": "excel", ".xls": "excel", ".json": "json", ".parquet": "parquet",
+    ".txt": "text", ".xml": "xml", ".html": "html", ".htm": "html", ".sql": "sql",
+    ".pkl": "pickle", ".pickle": "pickle",
+}
+
+
+def detect_file_type(path: str) -> Optional[str]:
+    """根据扩展名检测 read_file 的文件类型，不支持的格式返回 None。"""
+    return FILE_TYPES.get(os.path.splitext(path)[1].lower())
+
+
+class FileEntry:
+    """上传文件的索引项：解析后的实际路径与扫描时缓存的文件信息。"""
+
+    __slots__ = ("name", "path", "size", "mtime_ns", "file_type", "_fingerprint")
+
+    def __init__(self, name: str, path: str, size: int, mtime_ns: int):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.file_type = detect_file_type(path)
+        self._fingerprint = None
+
+    @property
+    def mtime(self) -> float:
+        return self.mtime_ns / 1e9
+
+    def refresh(self, stat: os.stat_result) -> "FileEntry":
+        """按最新的 stat 更新大小与修改时间；文件已被原地覆盖时丢弃已计算的指纹。"""
+        if stat.st_size != self.size or stat.st_mtime_ns != self.mtime_ns:
+            self.size, self.mtime_ns, self._fingerprint = stat.st_size, stat.st_mtime_ns, None
+        return self
+
+    @property
+    def fingerprint(self) -> str:
+        """文件内容指纹（同 file_fingerprint），同一版本的文件只计算一次。"""
+        if self._fingerprint is None:
+            self._fingerprint = file_fingerprint(self.path)
+        return self._fingerprint
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, registry: "UploadRegistry"):
+        super().__init__()
+        self.registry = registry
+
+    def on_any_event(self, event):
+        self.registry._dirty = True
+
+
+class UploadRegistry:
+    """
+    上传文件索引：首次查找时扫描一次上传目录（frontend/public/uploads 等候选位置，或 UPLOAD_DIR），
+    将逻辑名称（uploads/ 下的相对路径，或文件名）映射到实际路径与缓存的大小、修改时间、文件类型，
+    查找为字典访问，不再对每个候选目录逐一探测。
+    索引由后台线程维护：每隔 UPLOAD_INDEX_POLL_SECONDS 检查已存在目录的 mtime，发现变化时重新扫描；
+    每 _FULL_RESCAN_POLLS 次轮询完整扫描一次，以发现原地覆盖写入的文件和后来创建的上传目录。
+    设置 UPLOAD_INDEX_WATCH=1 且安装了 watchdog 时改为接收 inotify 等文件系统事件；
+    网络存储上的远端写入不会产生本地事件，此时应保持轮询。
+    """
+
+    _FULL_RESCAN_POLLS = 15
+
+    def __init__(self, roots: Optional[List[str]] = None, poll_interval: Optional[float] = None,
+                 watch: Optional[bool] = None):
+        if roots is None:
+            upload_dir = os.getenv("UPLOAD_DIR")
+            roots = [upload_dir] if upload_dir else [os.path.join(d, UPLOAD_PREFIX) for d in _PUBLIC_DIRS]
+        # 优先级从高到低；同名文件以优先级高的目录为准
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.poll_interval = poll_interval if poll_interval is not None else float(os.getenv("UPLOAD_INDEX_POLL_SECONDS", "2"))
+        self.watch = watch if watch is not None else os.getenv("UPLOAD_INDEX_WATCH", "0") == "1"
+        self._paths: Dict[str, FileEntry] = {}
+        self._names: Dict[str, FileEntry] = {}
+        self._dir_mtimes: Dict[str, Optional[int]] = {}
+        self._indexed = False
+        self._dirty = False
+        self._observer = None
+        self._poller: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.RLock()
+        self._scan_lock = threading.Lock()
+
+    @staticmethod
+    def logical_name(file_path: str) -> str:
+        """将 uploads/a.csv、/uploads/a.csv、a.csv 等写法统一为上传目录下的相对路径。"""
+        name = file_path.replace("\\", "/").lstrip("/")
+        if name.startswith(UPLOAD_PREFIX + "/"):
+            name = name[len(UPLOAD_PREFIX) + 1:]
+        return os.path.normpath(name).replace(os.sep, "/")
+
+    def _scan(self):
+        """扫描全部上传目录并重建索引；未变化的文件沿用原索引项，保留已计算的指纹。"""
+        with self._scan_lock:
+            self._dirty = False
+            paths: Dict[str, FileEntry] = {}
+            dir_mtimes: Dict[str, Optional[int]] = {}
+            for root in reversed(self.roots):
+                # 先记录目录 mtime 再读取内容，扫描期间新增的文件会在下次检查时发现
+                try:
+                    dir_mtimes[root] = os.stat(root).st_mtime_ns
+                except OSError:
+                    dir_mtimes[root] = None
+                    continue
+                stack = [root]
+                while stack:
+                    directory = stack.pop()
+                    try:
+                        with os.scandir(directory) as it:
+                            for item in it:
+                                if item.is_dir():
+                                    dir_mtimes[item.path] = item.stat().st_mtime_ns
+                                    stack.append(item.path)
+                                    continue
+                                if not item.is_file():
+                                    continue
+                                stat = item.stat()
+                                name = os.path.relpath(item.path, root).replace(os.sep, "/")
+                                old = self._paths.get(name)
+                                if (old is not None and old.path == item.path and old.size == stat.st_size
+                                        and old.mtime_ns == stat.st_mtime_ns):
+                                    paths[name] = old
+                                else:
+                                    paths[name] = FileEntry(name, item.path, stat.st_size, stat.st_mtime_ns)
+                    except OSError:
+                        continue
+
+            names: Dict[str, FileEntry] = {}
+            for name, entry in sorted(paths.items(), key=lambda item: item[0].count("/")):
+                names.setdefault(os.path.basename(name), entry)
+            with self._lock:
+                self._paths, self._names, self._dir_mtimes = paths, names, dir_mtimes
+                self._indexed = True
+
+    def _directories_changed(self) -> bool:
+        """只检查扫描时存在的目录；缺失的候选目录留给定期的完整扫描。"""
+        for directory, mtime in list(self._dir_mtimes.items()):
+            if mtime is None:
+                continue
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                current = None
+            if current != mtime:
+                return True
+        return False
+
+    def _poll(self):
+        polls = 0
+        while not self._stop.wait(self.poll_interval):
+            polls += 1
+            try:
+                if self._dirty or polls % self._FULL_RESCAN_POLLS == 0 or self._directories_changed():
+                    self._scan()
+            except Exception:
+                pass  # 轮询失败不影响已有索引，下次继续
+
+    def _start_background(self):
+        if self.watch and Observer is not None:
+            existing = [root for root in self.roots if os.path.isdir(root)]
+            if existing:
+                observer = Observer()
+                handler = _ChangeHandler(self)
+                for root in existing:
+                    observer.schedule(handler, root, recursive=True)
+                observer.daemon = True
+                observer.start()
+                self._observer = observer
+                return
+        self._poller = threading.Thread(target=self._poll, name="upload-registry-poll", daemon=True)
+        self._poller.start()
+
+    def _ensure_index(self):
+        if not self._indexed:
+            with self._lock:
+                if not self._indexed:
+                    self._scan()
+                    self._start_background()
+        elif self._dirty and self._observer is not None:
+            # 文件系统事件模式下，收到事件后的首次查找重新扫描
+            self._scan()
+
+    def _get(self, name: str) -> Optional[FileEntry]:
+        entry = self._paths.get(name)
+        if entry is None and "/" not in name:
+            entry = self._names.get(name)
+        return entry
+
+    def _probe(self, name: str) -> Optional[FileEntry]:
+        """
+        未命中时直接检查各已存在上传目录下的同名文件（通常只有一个目录），
+        发现轮询间隔内刚上传的文件，而不必等待后台扫描。
+        """
+        if name.startswith(".."):
+            return None
+        for root in self.roots:
+            if self._dir_mtimes.get(root) is None:
+                continue
+            path = os.path.join(root, *name.split("/"))
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if not os.path.isfile(path):
+                continue
+            entry = FileEntry(name, path, stat.st_size, stat.st_mtime_ns)
+            with self._lock:
+                self._paths.setdefault(name, entry)
+                self._names.setdefault(os.path.basename(name), entry)
+            return entry
+        return None
+
+    def lookup(self, file_path: str) -> Optional[FileEntry]:
+        """按逻辑名称查找上传文件，未找到时返回 None。"""
+        name = self.logical_name(file_path)
+        self._ensure_index()
+        with self._lock:
+            entry = self._get(name)
+        return entry if entry is not None else self._probe(name)
+
+    def names(self, limit: int = 20) -> List[str]:
+        """已索引的上传文件（逻辑名称），用于提示可用文件。"""
+        self._ensure_index()
+        with self._lock:
+            return sorted(self._paths)[:limit]
+
+    def close(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+
+
+upload_registry = UploadRegistry()
+
+_images_dir: Optional[str] = None
+_images_lock = threading.Lock()
+
+
+def get_images_dir() -> str:
+    """
+    图片保存目录：首次调用时按候选位置（frontend/public/images、public/images、images、static/images）
+    确定并创建，之后直接复用，不再在每次绘图时探测。
+    :raises OSError: 无法创建目录
+    """
+    global _images_dir
+    with _images_lock:
+        if _images_dir is None:
+            current_dir = os.getcwd()
+            candidates = [os.path.join(current_dir, d, "images") for d in _PUBLIC_DIRS]
+            candidates.append(os.path.join(current_dir, "static", "images"))
+            images_dir = os.path.join(current_dir, "images")
+            for path in candidates:
+                if os.path.exists(path) or os.access(os.path.dirname(path), os.W_OK):
+                    images_dir = path
+                    break
+            os.makedirs(images_dir, exist_ok=True)
+            _images_dir = images_dir
+        return _images_dir
@@ -9,11 +9,37 @@ import json
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
-import pymysql
 from langchain_tavily import TavilySearch
 import os
 import time
+import functools
+from contextlib import contextmanager
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Optional
+from src.agents.db import get_connection
+from src.agents.sql_planner import ExtractSpec, estimate_transfer_rows, get_guardrail_config, apply_guardrail
+from src.agents.schema_catalog import schema_catalog
+from src.agents.columnar import read_sql_columnar, get_dtype_backend
+from src.agents.session_store import session_store, session_id_from_config
+from src.agents.checkpoint import get_checkpointer
+from src.agents.history import compact_history
+from src.agents.expression import evaluate_expression, expression_names, ExpressionError
+from src.agents.progress import ProgressReporter, cancellable
+from src.agents.file_registry import upload_registry, detect_file_type, get_images_dir
+from src.agents.tool_cache import (tool_cache, is_cacheable_sql, referenced_tables, db_fingerprint,
+                                   file_fingerprint, variables_fingerprint, code_is_deterministic,
+                                   assigned_names)
+from src.agents.session_store import code_names
+from matplotlib.figure import Figure
+from matplotlib.axes import Axes
+import numpy as np
+import types
+import ast
+from langchain_core.messages import SystemMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.prebuilt.chat_agent_executor import AgentState
  
 # 加载环境变量
 load_dotenv(override=True)
@@ -46,25 +72,19 @@ def sql_inter(sql_query: str) -> str:
     """
     # print("正在调用 sql_inter 工具运行 SQL 查询...")
      
-    # 加载环境变量
-    load_dotenv(override=True)
-    host = os.getenv('HOST')
-    user = os.getenv('USER')
-    mysql_pw = os.getenv('MYSQL_PW')
-    db = os.getenv('DB_NAME')
-    port = os.getenv('PORT')
-     
-    # 创建连接
-    connection = pymysql.connect(
-        host=host,
-        user=user,
-        passwd=mysql_pw,
-        db=db,
-        port=int(port),
-        charset='utf8'
-    )
+    # 创建连接（启用连接池时复用池中连接）
+    connection = get_connection()
      
+    cache_key = None
     try:
+        # 只读且结果确定的查询，按所涉及表的版本指纹查找跨对话缓存
+        if tool_cache.enabled and is_cacheable_sql(sql_query):
+            fingerprint = db_fingerprint(connection, referenced_tables(sql_query))
+            if fingerprint:
+                cache_key = tool_cache.make_key("sql_inter", {"sql_query": sql_query.strip()}, fingerprint)
+                cached = tool_cache.get(cache_key)
+                if cached is not None:
+                    return cached[0]
         with connection.cursor() as cursor:
             cursor.execute(sql_query)
             results = cursor.fetchall()
@@ -72,68 +92,201 @@ def sql_inter(sql_query: str) -> str:
     finally:
         connection.close()
  
+    # 表结构变更后刷新结构缓存
+    schema_catalog.invalidate_if_ddl(sql_query)
+ 
     # 将结果以 JSON 字符串形式返回
-    return json.dumps(results, ensure_ascii=False)
+    result = json.dumps(results, ensure_ascii=False)
+    if cache_key:
+        tool_cache.put(cache_key, "sql_inter", result)
+    return result
+ 
+# ✅ 创建数据库结构查询工具
+class SchemaInfoSchema(BaseModel):
+    tables: list[str] = Field(description="需要查看结构的表名列表，为空表示全部表", default=[])
+    refresh: bool = Field(description="是否忽略缓存重新读取数据库结构", default=False)
+ 
+@tool(args_schema=SchemaInfoSchema)
+def schema_info(tables: list[str] = [], refresh: bool = False) -> str:
+    """
+    当需要了解数据库中的表、列、字段类型、索引或近似行数时，请调用该函数，
+    无需再通过sql_inter执行 SHOW TABLES、DESCRIBE 或 SELECT ... LIMIT 5。
+    结构信息来自 information_schema 并带TTL缓存，表结构变更后可设置 refresh=True 重新读取。
+    :param tables: 需要查看的表名列表，为空表示全部表
+    :param refresh: 是否强制刷新缓存
+    :return：紧凑格式的表结构描述
+    """
+    catalog = schema_catalog.get(refresh=refresh)
+    if not catalog:
+        return f"❌ 无法读取数据库结构：{schema_catalog.error or '数据库中没有数据表'}"
+    missing = [t for t in tables if t not in catalog]
+    result = schema_catalog.render(tables or None, max_chars=0)
+    if missing:
+        result += f"\n⚠️ 以下表不存在：{', '.join(missing)}。可用的表：{', '.join(catalog.keys())}"
+    return result
  
 # ✅ 创建数据提取工具
 # 定义结构化参数
 class ExtractQuerySchema(BaseModel):
-    sql_query: str = Field(description="用于从 MySQL 提取数据的 SQL 查询语句。")
+    sql_query: str = Field(description="用于从 MySQL 提取数据的 SQL 查询语句（与 spec 二选一，优先使用 spec）。", default="")
     df_name: str = Field(description="指定用于保存结果的 pandas 变量名称（字符串形式）。")
+    spec: Optional[ExtractSpec] = Field(description="声明式提取规格：列、过滤、分组、聚合、抽样比例、行数上限，将编译为SQL在数据库端执行。", default=None)
  
 # 注册为 Agent 工具
+@cancellable
 @tool(args_schema=ExtractQuerySchema)
-def extract_data(sql_query: str, df_name: str) -> str:
+def extract_data(df_name: str, sql_query: str = "", spec: Optional[ExtractSpec] = None,
+                 config: RunnableConfig = None) -> str:
     """
-    用于在MySQL数据库中提取一张表到当前Python环境中，注意，本函数只负责数据表的提取，
+    用于在MySQL数据库中提取数据到当前Python环境中，注意，本函数只负责数据的提取，
     并不负责数据查询，若需要在MySQL中进行数据查询，请使用sql_inter函数。
     同时需要注意，编写外部函数的参数消息时，必须是满足json格式的字符串，
-    :param sql_query: 字符串形式的SQL查询语句，用于提取MySQL中的某张表。
+    推荐使用spec参数声明所需的列、过滤条件和分组聚合，由数据库完成计算后只传输结果，
+    避免整表提取后再在pandas中聚合。
+    提取前会通过EXPLAIN估算传输行数，超过上限（EXTRACT_MAX_ROWS）时按EXTRACT_OVERSIZE_POLICY拒绝或在服务端抽样。
     :param df_name: 将MySQL数据库中提取的表格进行本地保存时的变量名，以字符串形式表示。
+    :param sql_query: 字符串形式的SQL查询语句，用于提取MySQL中的某张表。
+    :param spec: 声明式提取规格，例如 {"table": "orders", "columns": ["region"], "aggregates": [{"func": "sum", "column": "amount"}], "group_by": ["region"]}
     :return：表格读取和保存结果
     """
     print("正在调用 extract_data 工具运行 SQL 查询...")
-     
-    load_dotenv(override=True)
-    host = os.getenv('HOST')
-    user = os.getenv('USER')
-    mysql_pw = os.getenv('MYSQL_PW')
-    db = os.getenv('DB_NAME')
-    port = os.getenv('PORT')
+    if spec is None and not sql_query.strip():
+        return "❌ 执行失败：请提供 sql_query 或 spec 参数。"
+    progress = ProgressReporter("extract_data")
  
     # 创建数据库连接
-    connection = pymysql.connect(
-        host=host,
-        user=user,
-        passwd=mysql_pw,
-        db=db,
-        port=int(port),
-        charset='utf8'
-    )
+    connection = get_connection()
  
     try:
-        # 执行 SQL 并保存为全局变量
-        df = pd.read_sql(sql_query, connection)
-        globals()[df_name] = df
-        # print("数据成功提取并保存为全局变量：", df_name)
-        return f"✅ 成功创建 pandas 对象 `{df_name}`，包含从 MySQL 提取的数据。"
+        # 估算传输规模并应用护栏
+        progress.update("planning", "正在估算传输规模...", force=True)
+        source = spec if spec is not None else sql_query
+        estimated_rows, is_upper_bound = estimate_transfer_rows(connection, source)
+        max_rows, policy = get_guardrail_config()
+        sql, params, notice, row_cap = apply_guardrail(
+            source, estimated_rows, is_upper_bound, max_rows, policy, connection=connection)
+        if sql is None:
+            return notice
+        if estimated_rows is None:
+            estimate_info = "未能估算"
+        else:
+            estimate_info = f"{'≤' if is_upper_bound else '约'}{estimated_rows} 行"
+ 
+        def truncate(df):
+            # 无法可靠估计时查询多取了一行，据此判断结果是否被上限截断
+            if row_cap is not None and len(df) > row_cap:
+                return df.iloc[:row_cap], (f"⚠️ 结果超过上限 {row_cap} 行（估计：{estimate_info}），已只保留前 {row_cap} 行。"
+                                           f"如需完整结果，请通过过滤条件或分组聚合缩小结果集。\n")
+            return df, ""
+ 
+        # 未抽样的确定性查询，按表版本指纹查找跨对话缓存
+        dtype_backend = get_dtype_backend()
+        cache_key = None
+        if tool_cache.enabled and is_cacheable_sql(sql):
+            tables = [spec.table] if spec is not None else referenced_tables(sql)
+            fingerprint = db_fingerprint(connection, tables)
+            if fingerprint:
+                cache_key = tool_cache.make_key(
+                    "extract_data", {"sql": sql, "params": params, "dtype_backend": dtype_backend}, fingerprint)
+                cached = tool_cache.get(cache_key)
+                if cached is not None and isinstance(cached[1], pd.DataFrame):
+                    df, truncated = truncate(cached[1])
+                    session_store.set(session_id_from_config(config), df_name, df, base=globals())
+                    return (f"{notice}{truncated}✅ 成功创建 pandas 对象 `{df_name}`，包含从 MySQL 提取的数据（命中缓存，数据未变化）。\n"
+                            f"- 执行SQL：{sql}\n- 数据规模：{len(df)} 行，{df.shape[1]} 列")
+ 
+        # 执行 SQL 并保存为会话变量，每读取一批报告一次进度（同时作为取消检查点）
+        def report_rows(rows_read):
+            total = f" / {estimate_info}" if estimated_rows is not None else ""
+            progress.update("reading", f"已读取 {rows_read} 行{total}", rows=rows_read, total_rows=estimated_rows)
+        progress.update("reading", f"正在执行查询（预估 {estimate_info}）...", force=True, rows=0, total_rows=estimated_rows)
+        df = read_sql_columnar(connection, sql, params=params or None, dtype_backend=dtype_backend, progress=report_rows)
+        if cache_key:
+            tool_cache.put(cache_key, "extract_data", "", df)
+        df, truncated = truncate(df)
+        progress.update("saving", f"已读取 {len(df)} 行，正在保存为会话变量...", force=True, rows=len(df))
+        session_store.set(session_id_from_config(config), df_name, df, base=globals())
+        progress.done(f"提取完成：{len(df)} 行，{df.shape[1]} 列", rows=len(df))
+        # print("数据成功提取并保存为会话变量：", df_name)
+        return (f"{notice}{truncated}✅ 成功创建 pandas 对象 `{df_name}`，包含从 MySQL 提取的数据。\n"
+                f"- 执行SQL：{sql}\n- 预估传输：{estimate_info}，实际传输：{len(df)} 行，{df.shape[1]} 列")
     except Exception as e:
         return f"❌ 执行失败：{e}"
     finally:
         connection.close()
  
+# ✅ 会话变量空间
+# 无论会话由哪个调用方首先创建（如 pre_model_hook），都以本模块全局变量为初始内容
+session_store.set_default_base(globals())
+ 
+@contextmanager
+def _session_namespace(session_id: str, py_code: str = ""):
+    """
+    在 with 块内使用当前对话的变量空间（以本模块全局变量为初始内容），
+    并预先加载代码中引用到的已落盘变量；块内该会话的变量不会被回收。
+    """
+    try:
+        code = compile(py_code, "<session>", "exec") if py_code else None
+    except SyntaxError:
+        code = None
+    with session_store.use(session_id, globals(), code) as g:
+        yield g
+ 
+def _figure_cache_key(tool_name: str, args: dict, session_id: str, py_code: str) -> Optional[str]:
+    """
+    绘图结果的缓存键：绘图参数 + 代码所引用会话数据的内容指纹。
+    代码含随机性，引用了无法稳定描述的对象（如自定义函数），
+    或除图像变量 fname 外还会写入会话变量（命中时不执行代码，这些变量不会被创建）时返回 None，不做缓存。
+    """
+    if not tool_cache.enabled:
+        return None
+    try:
+        tree = ast.parse(py_code)
+        names = code_names(compile(tree, "<figure>", "exec"))
+    except SyntaxError:
+        return None
+    if not code_is_deterministic(names):
+        return None
+    # 重新导入已有的模块（如 import numpy as np）不改变会话
+    written = {name for name in assigned_names(tree) - {args.get("fname")}
+               if not isinstance(globals().get(name), types.ModuleType)}
+    if written:
+        return None
+    # 绘图工具写回的图像对象与模块不影响绘图结果
+    variables = {name: value for name, value in session_store.user_variables(session_id, names).items()
+                 if not isinstance(value, (Figure, Axes, types.ModuleType))
+                 and not (isinstance(value, np.ndarray) and value.dtype == object)}
+    fingerprint = variables_fingerprint(variables)
+    return tool_cache.make_key(tool_name, args, fingerprint) if fingerprint else None
+ 
+def _cached_figure(cache_key: Optional[str]) -> Optional[str]:
+    """返回缓存的绘图结果；图片文件已被删除时视为未命中。"""
+    if cache_key is None:
+        return None
+    cached = tool_cache.get(cache_key)
+    if cached is not None and cached[1] and os.path.exists(cached[1].get("abs_path", "")):
+        return cached[0]
+    return None
+ 
 # ✅创建Python代码执行工具
 # Python代码执行工具结构化参数说明
 class PythonCodeInput(BaseModel):
     py_code: str = Field(description="一段合法的 Python 代码字符串，例如 '2 + 2' 或 'x = 3\\ny = x * 2'")
  
 @tool(args_schema=PythonCodeInput)
-def python_inter(py_code):
+def python_inter(py_code, config: RunnableConfig = None):
     """
     当用户需要编写Python程序并执行时，请调用该函数。
     该函数可以执行一段Python代码并返回最终结果，需要注意，本函数只能执行非绘图类的代码，若是绘图相关代码，则需要调用fig_inter函数运行。
     """   
-    g = globals()
+    session_id = session_id_from_config(config)
+    try:
+        with _session_namespace(session_id, py_code) as g:
+            return _run_python(py_code, g)
+    finally:
+        session_store.commit(session_id)
+ 
+def _run_python(py_code: str, g: dict) -> str:
     try:
         # 尝试如果是表达式，则返回表达式运行结果
         return str(eval(py_code, g))
@@ -155,14 +308,109 @@ def python_inter(py_code):
             # print("代码已顺利执行，正在进行结果梳理...")
             return "已经顺利执行代码"
  
+# ✅ 创建向量化表达式计算工具
+# 表达式计算工具结构化参数说明
+class ExpressionInput(BaseModel):
+    expression: str = Field(description="算术或列表达式，例如 '(revenue - cost) / revenue'、'(sales - shift(sales, 1)) / shift(sales, 1)'，列名含空格等字符时用反引号包裹")
+    df_name: str = Field(description="参与计算的 DataFrame 变量名（可选，为空时仅做数值计算）", default="")
+    target_column: str = Field(description="将结果写入 df_name 中的新列名（可选）", default="")
+    result_name: str = Field(description="将结果另存为会话变量的名称（可选）", default="")
+ 
+@tool(args_schema=ExpressionInput)
+def numexpr_eval(expression: str, df_name: str = "", target_column: str = "", result_name: str = "",
+                 config: RunnableConfig = None) -> str:
+    """
+    当用户需要进行算术计算，或基于DataFrame的列计算比率、差值、增长率、条件标记等新列时，请优先调用该函数，
+    而不是使用python_inter。该函数使用numexpr多线程向量化求值，不执行任意Python代码。
+    表达式语法：
+    1. 运算符：+ - * / ** %，比较 == != > >= < <=，逻辑 & | ~
+    2. 函数：sqrt、log、log10、exp、abs、where(条件, 真值, 假值)、sum、prod 等
+    3. shift(列名, n)：引用前 n 行的值，用于计算环比、增长率
+    4. 常量：pi、e；也可以引用会话中的数值变量
+    示例：
+    - 数值计算：expression="37593 * 67"
+    - 新增毛利率列：expression="(revenue - cost) / revenue", df_name="df", target_column="margin"
+    - 环比增长率：expression="(sales - shift(sales, 1)) / shift(sales, 1)", df_name="df", target_column="growth"
+    """
+    session_id = session_id_from_config(config)
+    with _session_namespace(session_id) as g:
+        return _numexpr_eval(session_id, g, expression, df_name, target_column, result_name)
+ 
+def _numexpr_eval(session_id: str, g: dict, expression: str, df_name: str, target_column: str,
+                  result_name: str) -> str:
+    df = None
+    if df_name:
+        df = session_store.get(session_id, df_name)
+        if not isinstance(df, pd.DataFrame):
+            return f"❌ 未找到 DataFrame 变量 `{df_name}`，请先使用 read_file 或 extract_data 加载数据。"
+    # 表达式引用的数值变量可能已落盘，求值前加载（列名不加载）
+    names = expression_names(expression) - (set(df.columns) if df is not None else set())
+    session_store.ensure_loaded(session_id, names)
+    try:
+        result = evaluate_expression(expression, df, scalars=g)
+    except ExpressionError as e:
+        return f"❌ {e}"
+ 
+    if result.ndim == 0 and target_column and df is not None:
+        # 常量表达式写入列时广播到每一行
+        result = np.full(len(df), result.item())
+    if result.ndim == 0:
+        value = result.item()
+        if result_name:
+            session_store.set(session_id, result_name, value)
+            return f"✅ 计算结果：{value}\n💾 已保存为变量 `{result_name}`"
+        return f"✅ 计算结果：{value}"
+ 
+    series = pd.Series(result, index=df.index if df is not None and len(df) == len(result) else None,
+                       name=target_column or result_name or None)
+    result_msg = f"✅ 计算完成：{len(series)} 个值，类型 {series.dtype}\n"
+    if target_column and df is not None:
+        if len(series) != len(df):
+            return f"❌ 计算结果有 {len(series)} 个值，与 `{df_name}` 的行数 {len(df)} 不一致，无法写入列 `{target_column}`。"
+        df[target_column] = series.to_numpy()
+        session_store.commit(session_id, [df_name])
+        result_msg += f"💾 已写入 `{df_name}['{target_column}']`\n"
+    if result_name:
+        session_store.set(session_id, result_name, series)
+        result_msg += f"💾 已保存为变量 `{result_name}`\n"
+    result_msg += f"🔍 前5个值：{series.head().tolist()}"
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        result_msg += f"\n📊 统计：均值 {series.mean():.4g}，最小值 {series.min():.4g}，最大值 {series.max():.4g}，缺失 {int(series.isna().sum())} 个"
+    return result_msg
+ 
+# ✅ 绘图渲染线程
+# matplotlib 并非线程安全，所有绘图工具在同一个常驻线程中串行渲染
+_render_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+ 
+def render_in_worker(func):
+    """将绘图工具的执行调度到渲染线程，并在调用线程中等待结果（携带调用方的上下文，以便发送进度事件）。"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        context = contextvars.copy_context()
+        return _render_worker.submit(context.run, func, *args, **kwargs).result()
+    return wrapper
+ 
+def warm_up_render_worker():
+    """在渲染线程中预先初始化 Agg 后端与字体缓存，避免首个绘图请求承担冷启动开销。"""
+    def _warm_up():
+        matplotlib.use('Agg')
+        fig = plt.figure(figsize=(1, 1))
+        plt.plot([0, 1], [0, 1])
+        plt.title("warm up")
+        fig.canvas.draw()
+        plt.close(fig)
+    _render_worker.submit(_warm_up).result()
+ 
 # ✅ 创建绘图工具
 # 绘图工具结构化参数说明
 class FigCodeInput(BaseModel):
     py_code: str = Field(description="要执行的 Python 绘图代码，必须使用 matplotlib/seaborn 创建图像并赋值给变量")
     fname: str = Field(description="图像对象的变量名，例如 'fig'，用于从代码中提取并保存为图片")
  
+@cancellable
 @tool(args_schema=FigCodeInput)
-def fig_inter(py_code: str, fname: str) -> str:
+@render_in_worker
+def fig_inter(py_code: str, fname: str, config: RunnableConfig = None) -> str:
     """
     当用户需要使用 Python 进行可视化绘图任务时，请调用该函数。
  
@@ -192,43 +440,28 @@ def fig_inter(py_code: str, fname: str) -> str:
  
     local_vars = {"plt": plt, "pd": pd, "sns": sns}
      
-    # 动态设置图片保存路径（支持不同操作系统）
-    current_dir = os.getcwd()
-    
-    # 尝试多个可能的图片保存路径
-    possible_paths = [
-        os.path.join(current_dir, "frontend", "public", "images"),
-        os.path.join(current_dir, "public", "images"),
-        os.path.join(current_dir, "images"),
-        os.path.join(current_dir, "static", "images")
-    ]
-    
-    images_dir = None
-    for path in possible_paths:
-        try:
-            if os.path.exists(path) or os.access(os.path.dirname(path), os.W_OK):
-                images_dir = path
-                break
-        except:
-            continue
-    
-    # 如果找不到合适的路径，使用当前目录下的images文件夹
-    if images_dir is None:
-        images_dir = os.path.join(current_dir, "images")
-    
-    # 创建图片目录
+    # 图片保存目录（首次绘图时确定并创建，之后复用）
     try:
-        os.makedirs(images_dir, exist_ok=True)
+        images_dir = get_images_dir()
     except Exception as e:
-        return f"❌ 无法创建图片目录 {images_dir}：{str(e)}"
+        return f"❌ 无法创建图片目录：{str(e)}"
     
+    session_id = session_id_from_config(config)
     try:
-        g = globals()
-        exec(py_code, g, local_vars)
-        g.update(local_vars)
+        with _session_namespace(session_id, py_code) as g:
+            cache_key = _figure_cache_key("fig_inter", {"py_code": py_code, "fname": fname}, session_id, py_code)
+            cached = _cached_figure(cache_key)
+            if cached is not None:
+                return cached
+            progress = ProgressReporter("fig_inter")
+            progress.update("executing", "正在执行绘图代码...", force=True)
+            exec(py_code, g, local_vars)
+            g.update(local_vars)
+        session_store.commit(session_id)
  
         fig = local_vars.get(fname, None)
         if fig:
+            progress.update("rendering", "正在渲染并保存图片...", force=True)
             # 生成带时间戳的文件名
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             image_filename = f"{fname}_{timestamp}.png"
@@ -236,7 +469,11 @@ def fig_inter(py_code: str, fname: str) -> str:
             rel_path = os.path.join("images", image_filename)    # ✅ 返回相对路径（给前端用）
  
             fig.savefig(abs_path, bbox_inches='tight')
-            return f"✅ 图片已保存，路径为: {rel_path}"
+            result = f"✅ 图片已保存，路径为: {rel_path}"
+            if cache_key:
+                tool_cache.put(cache_key, "fig_inter", result, {"abs_path": abs_path})
+            progress.done(f"图片已保存：{rel_path}")
+            return result
         else:
             return "⚠️ 图像对象未找到，请确认变量名正确并为 matplotlib 图对象。"
     except Exception as e:
@@ -255,9 +492,46 @@ class ReadFileSchema(BaseModel):
     preview_lines: int = Field(description="预览行数（可选，0表示不预览）", default=5)
     get_file_info: bool = Field(description="是否获取文件信息", default=True)
 
+def _save_read_result(result_msg: str, df: pd.DataFrame, df_name: str, config: RunnableConfig) -> str:
+    # 保存为会话变量
+    if df_name:
+        session_store.set(session_id_from_config(config), df_name, df, base=globals())
+        result_msg += f"\n💾 数据已保存为变量 `{df_name}`，可用于后续分析。"
+    else:
+        result_msg += f"\n💡 提示：未指定变量名，数据未保存。如需保存请指定df_name参数。"
+    return result_msg
+ 
+# CSV 分块读取的块大小（行）；用户自行指定了分块/行数参数时按原方式一次读取
+_CSV_CHUNK_ROWS = 100000
+
+def _read_csv_with_progress(file_path: str, read_params: dict, progress: ProgressReporter) -> pd.DataFrame:
+    """
+    分块读取CSV，每块报告已读行数与已解析字节数（同时作为取消检查点）。
+    pyarrow 引擎、skipfooter 等不支持分块的参数，改为一次性读取并定期发送心跳。
+    """
+    if any(k in read_params for k in ("chunksize", "iterator", "nrows")):
+        return pd.read_csv(file_path, **read_params)
+    if read_params.get("engine") == "pyarrow" or read_params.get("skipfooter"):
+        with progress.heartbeat("parsing", "正在解析CSV文件"):
+            return pd.read_csv(file_path, **read_params)
+    chunks = []
+    rows_read = 0
+    with open(file_path, "rb") as f:
+        total_bytes = os.fstat(f.fileno()).st_size
+        for chunk in pd.read_csv(f, chunksize=_CSV_CHUNK_ROWS, **read_params):
+            chunks.append(chunk)
+            rows_read += len(chunk)
+            progress.update("parsing", f"已读取 {rows_read} 行（{f.tell() * 100 // max(total_bytes, 1)}%）",
+                            rows=rows_read, bytes_read=f.tell(), total_bytes=total_bytes)
+    if not chunks:
+        return pd.read_csv(file_path, **read_params)
+    return pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+
+@cancellable
 @tool(args_schema=ReadFileSchema)
 def read_file(file_path: str, file_type: str = "auto", read_params: dict = {}, 
-              df_name: str = "", preview_lines: int = 5, get_file_info: bool = True) -> str:
+              df_name: str = "", preview_lines: int = 5, get_file_info: bool = True,
+              config: RunnableConfig = None) -> str:
     """
     当用户需要读取本地文件时，请调用该函数。
     该函数支持多种文件格式的读取，包括CSV、Excel、JSON、Parquet、文本文件、XML、HTML、SQL、Pickle等。
@@ -297,40 +571,45 @@ def read_file(file_path: str, file_type: str = "auto", read_params: dict = {},
     """
     
     try:
-        # 处理前端上传的文件路径
+        # 处理前端上传的文件路径：从上传文件索引中查找（frontend/public/uploads/ 等目录）
+        upload_entry = None
         if file_path.startswith("uploads/"):
-            # 前端上传的文件在frontend/public/uploads/目录下
-            current_dir = os.getcwd()
-            # 尝试多个可能的路径
-            possible_paths = [
-                os.path.join(current_dir, "frontend", "public", file_path),
-                os.path.join(current_dir, "public", file_path),
-                os.path.join(current_dir, file_path),
-            ]
-            
-            # 找到第一个存在的文件路径
-            actual_file_path = None
-            for path in possible_paths:
-                if os.path.exists(path):
-                    actual_file_path = path
-                    break
-            
-            if actual_file_path is None:
-                return f"❌ 文件不存在：{file_path}。尝试的路径：{', '.join(possible_paths)}"
-            
-            file_path = actual_file_path
+            upload_entry = upload_registry.lookup(file_path)
+            if upload_entry is None:
+                available = upload_registry.names()
+                return f"❌ 文件不存在：{file_path}。已上传的文件：{', '.join(available) if available else '无'}"
+        elif not os.path.exists(file_path):
+            # 只给出文件名时，按上传文件名查找
+            upload_entry = upload_registry.lookup(file_path)
+            if upload_entry is None:
+                return f"❌ 文件不存在：{file_path}"
         
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
-            return f"❌ 文件不存在：{file_path}"
+        # 上传文件由索引解析实际路径；文件信息读取一次 stat，原地覆盖写入后重新计算指纹
+        if upload_entry is not None:
+            file_path = upload_entry.path
+            stat = os.stat(file_path)
+            fingerprint = upload_entry.refresh(stat).fingerprint
+        else:
+            stat = os.stat(file_path)
+            fingerprint = file_fingerprint(file_path)
+        file_size, file_mtime = stat.st_size, stat.st_mtime
+        progress = ProgressReporter("read_file")
+        
+        # 按文件内容版本查找跨对话缓存，命中时无需重新解析文件
+        cache_key = tool_cache.make_key(
+            "read_file",
+            {"file_type": file_type, "read_params": read_params, "preview_lines": preview_lines, "get_file_info": get_file_info},
+            fingerprint,
+        )
+        cached = tool_cache.get(cache_key)
+        if cached is not None and isinstance(cached[1], pd.DataFrame):
+            return _save_read_result(cached[0] + "\n♻️ 文件未变化，已复用缓存的解析结果。", cached[1], df_name, config)
         
         # 获取文件信息
         file_info = ""
         if get_file_info:
             try:
-                stat = os.stat(file_path)
-                file_size = stat.st_size
-                modified_time = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+                modified_time = datetime.fromtimestamp(file_mtime).strftime('%Y-%m-%d %H:%M:%S')
                 
                 # 格式化文件大小
                 if file_size < 1024:
@@ -368,25 +647,8 @@ def read_file(file_path: str, file_type: str = "auto", read_params: dict = {},
         
         # 如果未指定文件类型，根据扩展名自动检测
         if file_type == "auto":
-            if file_extension == ".csv":
-                file_type = "csv"
-            elif file_extension in [".xlsx", ".xls"]:
-                file_type = "excel"
-            elif file_extension == ".json":
-                file_type = "json"
-            elif file_extension == ".parquet":
-                file_type = "parquet"
-            elif file_extension == ".txt":
-                file_type = "text"
-            elif file_extension == ".xml":
-                file_type = "xml"
-            elif file_extension in [".html", ".htm"]:
-                file_type = "html"
-            elif file_extension == ".sql":
-                file_type = "sql"
-            elif file_extension in [".pkl", ".pickle"]:
-                file_type = "pickle"
-            else:
+            file_type = upload_entry.file_type if upload_entry is not None else detect_file_type(file_path)
+            if file_type is None:
                 return f"❌ 不支持的文件格式：{file_extension}。支持的格式：CSV, Excel, JSON, Parquet, TXT, XML, HTML, SQL, Pickle"
         
         # 根据文件类型读取数据
@@ -394,23 +656,27 @@ def read_file(file_path: str, file_type: str = "auto", read_params: dict = {},
         read_method = ""
         
         if file_type == "csv":
-            df = pd.read_csv(file_path, **read_params)
+            df = _read_csv_with_progress(file_path, read_params, progress)
             read_method = "pd.read_csv()"
         elif file_type == "excel":
-            df = pd.read_excel(file_path, **read_params)
+            with progress.heartbeat("parsing", f"正在解析Excel文件（{file_size} 字节）"):
+                df = pd.read_excel(file_path, **read_params)
             read_method = "pd.read_excel()"
         elif file_type == "json":
-            df = pd.read_json(file_path, **read_params)
+            with progress.heartbeat("parsing", "正在解析JSON文件"):
+                df = pd.read_json(file_path, **read_params)
             read_method = "pd.read_json()"
         elif file_type == "parquet":
-            df = pd.read_parquet(file_path, **read_params)
+            with progress.heartbeat("parsing", "正在读取Parquet文件"):
+                df = pd.read_parquet(file_path, **read_params)
             read_method = "pd.read_parquet()"
         elif file_type == "text":
             df = pd.read_table(file_path, **read_params)
             read_method = "pd.read_table()"
         elif file_type == "xml":
             try:
-                df = pd.read_xml(file_path, **read_params)
+                with progress.heartbeat("parsing", "正在解析XML文件"):
+                    df = pd.read_xml(file_path, **read_params)
                 read_method = "pd.read_xml()"
             except ImportError:
                 return f"❌ 读取XML文件需要安装lxml库。请运行：pip install lxml"
@@ -479,13 +745,10 @@ def read_file(file_path: str, file_type: str = "auto", read_params: dict = {},
             except Exception as e:
                 result_msg += f"\n⚠️ 数据预览失败：{str(e)}"
         
-        # 保存为全局变量
-        if df_name:
-            globals()[df_name] = df
-            result_msg += f"\n💾 数据已保存为变量 `{df_name}`，可用于后续分析。"
-        else:
-            result_msg += f"\n💡 提示：未指定变量名，数据未保存。如需保存请指定df_name参数。"
-            
+        progress.update("saving", f"已解析 {df.shape[0]} 行，正在保存...", force=True, rows=int(df.shape[0]))
+        tool_cache.put(cache_key, "read_file", result_msg, df)
+        result_msg = _save_read_result(result_msg, df, df_name, config)
+        progress.done(f"读取完成：{df.shape[0]} 行，{df.shape[1]} 列", rows=int(df.shape[0]))
         return result_msg
             
     except FileNotFoundError:
@@ -516,11 +779,14 @@ class OptimizedFigCodeInput(BaseModel):
     compression_level: int = Field(description="PNG压缩级别（0-9，0无压缩，9最大压缩）", default=6)
     add_metadata: bool = Field(description="是否添加图片元数据", default=True)
 
+@cancellable
 @tool(args_schema=OptimizedFigCodeInput)
+@render_in_worker
 def optimized_fig_inter(py_code: str, fname: str, format: str = "png", dpi: int = 300, 
                        quality: int = 95, optimize: bool = True, figsize: str = None,
                        auto_resize: bool = False, webp_quality: int = 85, 
-                       compression_level: int = 6, add_metadata: bool = True) -> str:
+                       compression_level: int = 6, add_metadata: bool = True,
+                       config: RunnableConfig = None) -> str:
     """
     当用户需要进行高质量图片生成和优化时，请调用该函数。
     这是fig_inter工具的增强版本，提供更多图片质量控制选项和格式支持。
@@ -585,35 +851,11 @@ def optimized_fig_inter(py_code: str, fname: str, format: str = "png", dpi: int
         # 设置本地变量
         local_vars = {"plt": plt, "pd": pd, "sns": sns}
         
-        # 动态设置图片保存路径（支持不同操作系统）
-        current_dir = os.getcwd()
-        
-        # 尝试多个可能的图片保存路径
-        possible_paths = [
-            os.path.join(current_dir, "frontend", "public", "images"),
-            os.path.join(current_dir, "public", "images"),
-            os.path.join(current_dir, "images"),
-            os.path.join(current_dir, "static", "images")
-        ]
-        
-        images_dir = None
-        for path in possible_paths:
-            try:
-                if os.path.exists(path) or os.access(os.path.dirname(path), os.W_OK):
-                    images_dir = path
-                    break
-            except:
-                continue
-        
-        # 如果找不到合适的路径，使用当前目录下的images文件夹
-        if images_dir is None:
-            images_dir = os.path.join(current_dir, "images")
-        
-        # 创建图片目录
+        # 图片保存目录（首次绘图时确定并创建，之后复用）
         try:
-            os.makedirs(images_dir, exist_ok=True)
+            images_dir = get_images_dir()
         except Exception as e:
-            return f"❌ 无法创建图片目录 {images_dir}：{str(e)}"
+            return f"❌ 无法创建图片目录：{str(e)}"
         
         # 处理图片尺寸参数
         original_figsize = None
@@ -629,9 +871,23 @@ def optimized_fig_inter(py_code: str, fname: str, format: str = "png", dpi: int
         
         try:
             # 执行绘图代码
-            g = globals()
-            exec(py_code, g, local_vars)
-            g.update(local_vars)
+            session_id = session_id_from_config(config)
+            with _session_namespace(session_id, py_code) as g:
+                cache_key = _figure_cache_key(
+                    "optimized_fig_inter",
+                    {"py_code": py_code, "fname": fname, "format": format, "dpi": dpi, "quality": quality,
+                     "optimize": optimize, "auto_resize": auto_resize, "webp_quality": webp_quality,
+                     "compression_level": compression_level, "add_metadata": add_metadata},
+                    session_id, py_code,
+                )
+                cached = _cached_figure(cache_key)
+                if cached is not None:
+                    return cached
+                progress = ProgressReporter("optimized_fig_inter")
+                progress.update("executing", "正在执行绘图代码...", force=True)
+                exec(py_code, g, local_vars)
+                g.update(local_vars)
+            session_store.commit(session_id)
             
             fig = local_vars.get(fname, None)
             if fig is None:
@@ -696,6 +952,7 @@ def optimized_fig_inter(py_code: str, fname: str, format: str = "png", dpi: int
                 } if add_metadata else None
             
             # 保存图片
+            progress.update("rendering", f"正在以 {dpi} DPI 渲染 {format.upper()} 图片...", force=True)
             try:
                 fig.savefig(abs_path, **save_kwargs)
             except Exception as e:
@@ -716,6 +973,7 @@ def optimized_fig_inter(py_code: str, fname: str, format: str = "png", dpi: int
             # 后处理优化（针对支持的格式）
             optimization_info = ""
             if optimize and format in ['png', 'jpg', 'jpeg', 'webp']:
+                progress.update("optimizing", "正在压缩优化图片...", force=True)
                 try:
                     from PIL import Image
                     original_size = os.path.getsize(abs_path)
@@ -759,6 +1017,9 @@ def optimized_fig_inter(py_code: str, fname: str, format: str = "png", dpi: int
             if auto_resize:
                 result_msg += f"\n📐 已启用自动尺寸调整"
             
+            if cache_key:
+                tool_cache.put(cache_key, "optimized_fig_inter", result_msg, {"abs_path": abs_path})
+            progress.done(f"图片已保存：{rel_path}")
             return result_msg
             
         except SyntaxError as e:
@@ -791,16 +1052,23 @@ prompt = """
 2. **数据库查询：**
    - 当用户需要获取数据库中某些数据或进行SQL查询时，请调用`sql_inter`工具，该工具已经内置了pymysql连接MySQL数据库的全部参数，包括数据库名称、用户名、密码、端口等，你只需要根据用户需求生成SQL语句即可。
    - 你需要准确根据用户请求生成SQL语句，例如 `SELECT * FROM 表名` 或包含条件的查询。
+   - 下方已提供缓存的数据库结构（表、列、类型、索引、近似行数），请直接据此编写SQL；如需查看被截断的表或刷新结构，请调用`schema_info`工具，不要使用`sql_inter`执行 SHOW TABLES、DESCRIBE 或抽样查询来探查结构。
  
 3. **数据表提取：**
    - 当用户希望将数据库中的表格导入Python环境进行后续分析时，请调用`extract_data`工具。
-   - 你需要根据用户提供的表名或查询条件生成SQL查询语句，并将数据保存到指定的pandas变量中。
+   - 优先使用`spec`参数声明所需的列（columns）、过滤条件（filters）、分组（group_by）、聚合（aggregates）、抽样比例（sample_fraction）和行数上限（limit），让数据库完成聚合后只传输结果，不要整表提取后再在pandas中聚合。
+   - 示例：spec={"table": "orders", "columns": ["region"], "filters": [{"column": "year", "op": "=", "value": 2024}], "group_by": ["region"], "aggregates": [{"func": "sum", "column": "amount", "alias": "total_amount"}]}
+   - 也可以直接提供`sql_query`，同样应在SQL中完成过滤和聚合。提取规模超过上限时，工具会拒绝执行或在服务端抽样。
  
 4. **非绘图类任务的Python代码执行：**
    - 当用户需要执行Python脚本或进行数据处理、统计计算时，请调用`python_inter`工具。
    - 仅限执行非绘图类代码，例如变量定义、数据分析等。
  
-5. **绘图类Python代码执行（增强版）：**
+5. **向量化表达式计算：**
+   - 当用户需要进行算术计算，或基于数据表的列计算比率、差值、增长率、条件标记等新列时，请优先调用`numexpr_eval`工具，而不是`python_inter`。
+   - 示例：expression="(revenue - cost) / revenue", df_name="df", target_column="margin"；环比增长率使用 shift(列名, 1)。
+ 
+6. **绘图类Python代码执行（增强版）：**
    - 当用户需要进行可视化展示（如生成图表、绘制分布等）时：
      * 基础绘图：使用`fig_inter`工具（简单快速）
      * 高质量绘图：使用`optimized_fig_inter`工具（推荐）
@@ -819,7 +1087,7 @@ prompt = """
      * 高质量WebP：format="webp", webp_quality=85, optimize=True
      * 自适应尺寸：auto_resize=True, figsize="12,8"
  
-6. **网络搜索：**
+7. **网络搜索：**
    - 当用户提出与数据分析无关的问题（如最新新闻、实时信息），请调用`search_tool`工具。
  
 **工具使用优先级和最佳实践：**
@@ -847,11 +1115,37 @@ prompt = """
 请根据以上原则为用户提供精准、高效的协助。
 """
  
+# ✅ 在提示词中附加缓存的数据库结构
+def build_prompt(state) -> list:
+    return [SystemMessage(content=prompt + schema_catalog.prompt_section())] + state["messages"]
+ 
+# ✅ 图状态：在检查点中记录会话变量的落盘引用与上下文压缩统计
+class DataAgentState(AgentState):
+    session_vars: dict
+    context_stats: dict
+ 
+def pre_model_hook(state: DataAgentState, config: RunnableConfig) -> dict:
+    """
+    模型调用前执行：
+    1. 同步会话变量引用；重启后可根据检查点中的引用恢复落盘数据。
+    2. 压缩较早的工具输出并按token预算裁剪历史，仅影响本次模型输入。
+    """
+    session_id = session_id_from_config(config)
+    session_store.restore(session_id, state.get("session_vars"))
+    session_vars = session_store.references(session_id)
+    messages, stats = compact_history(state["messages"], variables=session_vars.keys())
+    return {"session_vars": session_vars, "context_stats": stats, "llm_input_messages": messages}
+ 
 # ✅ 创建工具列表
-tools = [search_tool, python_inter, fig_inter, optimized_fig_inter, sql_inter, extract_data, read_file]
+tools = [search_tool, python_inter, numexpr_eval, fig_inter, optimized_fig_inter, sql_inter, extract_data, schema_info, read_file]
  
 # ✅ 创建模型
 model = ChatOpenAI(model="ep-20250418165946-fjjmv")
  
 # ✅ 创建图 （Agent）
-graph = create_react_agent(model=model, tools=tools, prompt=prompt)
\ No newline at end of file
+def build_graph(model, checkpointer=None):
+    """使用指定模型创建Agent图，批处理模式可传入本地模型进行离线测试。"""
+    return create_react_agent(model=model, tools=tools, prompt=build_prompt, state_schema=DataAgentState,
+                              pre_model_hook=pre_model_hook, checkpointer=checkpointer)
+ 
+graph = build_graph(model, checkpointer=get_checkpointer())
\ No newline at end of file
@@ -0,0 +1,124 @@
+import os
+from typing import Iterable, Optional
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+
+# 压缩后工具输出保留的开头字符数
+_SUMMARY_HEAD_CHARS = 200
+
+
+def get_history_config() -> tuple:
+    """读取历史压缩配置：(保留原文的最近工具消息数, 发送给模型的token预算)。"""
+    keep_tool_messages = int(os.getenv("HISTORY_KEEP_TOOL_MESSAGES", "3"))
+    max_tokens = int(os.getenv("HISTORY_MAX_TOKENS", "16000"))
+    return keep_tool_messages, max_tokens
+
+
+def _content_text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in message.content)
+
+
+def summarize_tool_message(message: ToolMessage, variables: Iterable[str] = ()) -> ToolMessage:
+    """
+    将一条工具输出压缩为摘要：保留首行与开头片段、原始长度，以及其中提到的会话变量名，
+    以便模型知道可以通过变量名继续访问完整数据，而无需在上下文中重复携带原文。
+    """
+    text = _content_text(message)
+    tokens = count_tokens_approximately([message])
+    # 单行输出（如 sql_inter 的 JSON 结果）同样按开头字符数截断，摘要不会比原文更长
+    stripped = text.strip()
+    first_line = stripped.splitlines()[0][:_SUMMARY_HEAD_CHARS] if stripped else ""
+    rest = stripped[len(first_line):].strip()
+    head = rest[:_SUMMARY_HEAD_CHARS].replace("\n", " ")
+    referenced = [name for name in variables if name and name in text]
+
+    summary = f"[已压缩的 {message.name or '工具'} 输出，原文约 {tokens} tokens] {first_line}"
+    if head:
+        summary += f"\n片段：{head}{'...' if len(rest) > _SUMMARY_HEAD_CHARS else ''}"
+    if referenced:
+        summary += f"\n涉及会话变量：{', '.join(referenced)}（可在 python_inter 中直接使用查看完整数据）"
+    if len(summary) >= len(text):
+        return message  # 原文本身很短时保留原文
+    return ToolMessage(content=summary, tool_call_id=message.tool_call_id, name=message.name,
+                       id=message.id, status=getattr(message, "status", "success"))
+
+
+def truncate_tool_message(message: ToolMessage, max_chars: int) -> ToolMessage:
+    """截断过长的工具输出原文，保留开头 max_chars 个字符并注明截断。"""
+    text = _content_text(message)
+    if len(text) <= max_chars:
+        return message
+    content = f"{text[:max_chars]}\n...[输出过长，已截断，原文共 {len(text)} 个字符]"
+    return ToolMessage(content=content, tool_call_id=message.tool_call_id, name=message.name,
+                       id=message.id, status=getattr(message, "status", "success"))
+
+
+def _fit_current_turn(messages: list, max_tokens: int) -> list:
+    """
+    当前轮次本身就超出预算时：保留系统消息与最后一条用户消息之后的全部消息，
+    并按剩余预算平均截断其中的工具输出原文。
+    """
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+    head = [m for m in messages[:last_human] if isinstance(m, SystemMessage)]
+    turn = messages[last_human:]
+    tool_positions = [i for i, m in enumerate(turn) if isinstance(m, ToolMessage)]
+    if not tool_positions:
+        return head + turn
+    others = head + [m for m in turn if not isinstance(m, ToolMessage)]
+    available = max_tokens - count_tokens_approximately(others)
+    # count_tokens_approximately 约按 4 个字符计 1 个 token
+    max_chars = max(available // len(tool_positions) * 4, _SUMMARY_HEAD_CHARS)
+    turn = [truncate_tool_message(m, max_chars) if i in tool_positions else m for i, m in enumerate(turn)]
+    return head + turn
+
+
+def compact_history(messages: list, variables: Iterable[str] = (), keep_tool_messages: Optional[int] = None,
+                    max_tokens: Optional[int] = None) -> tuple:
+    """
+    压缩发送给模型的消息历史：
+    1. 最近 keep_tool_messages 条工具输出保留原文，更早的工具输出替换为摘要；
+    2. 若仍超过 max_tokens，从最早的完整轮次开始裁剪（保持工具调用与结果成对）；
+       当前轮次本身就超出预算时，只保留当前轮次并截断其中的工具输出原文。
+    只影响本次模型输入，检查点中的完整历史保持不变。
+    :return: (压缩后的消息列表, 统计信息 dict)
+    """
+    default_keep, default_max = get_history_config()
+    keep_tool_messages = default_keep if keep_tool_messages is None else keep_tool_messages
+    max_tokens = default_max if max_tokens is None else max_tokens
+    variables = list(variables)
+
+    tokens_before = count_tokens_approximately(messages)
+    tool_positions = [i for i, m in enumerate(messages) if isinstance(m, ToolMessage)]
+    old_positions = set(tool_positions[:max(len(tool_positions) - keep_tool_messages, 0)])
+    compacted = [
+        summarize_tool_message(m, variables) if i in old_positions else m
+        for i, m in enumerate(messages)
+    ]
+
+    if max_tokens > 0 and count_tokens_approximately(compacted) > max_tokens:
+        trimmed = trim_messages(
+            compacted,
+            max_tokens=max_tokens,
+            token_counter=count_tokens_approximately,
+            strategy="last",
+            start_on="human",
+            include_system=True,
+            allow_partial=False,
+        )
+        # 裁剪结果不含任何用户消息时，说明当前轮次本身就超出预算
+        if any(isinstance(m, HumanMessage) for m in trimmed):
+            compacted = trimmed
+        else:
+            compacted = _fit_current_turn(compacted, max_tokens)
+
+    tokens_after = count_tokens_approximately(compacted)
+    stats = {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+        "compacted_tool_messages": len(old_positions),
+        "dropped_messages": len(messages) - len(compacted),
+    }
+    return compacted, stats
@@ -0,0 +1,173 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from typing import Optional
+from langgraph.config import get_config, get_stream_writer
+from src.agents.session_store import session_id_from_config
+
+# 自定义流事件类型，前端据此展示工具执行进度
+PROGRESS_EVENT_TYPE = "tool_progress"
+
+# 当前工具调用的取消标记，以及每个对话中正在执行的工具调用
+_cancel_event: contextvars.ContextVar = contextvars.ContextVar("tool_cancel_event", default=None)
+_active_calls: dict = {}
+_active_lock = threading.Lock()
+
+
+class ToolCancelled(BaseException):
+    """
+    工具调用已被取消（客户端断开连接或运行超时）。
+    与 asyncio.CancelledError 一样继承 BaseException，不会被工具内部的 except Exception 吞掉。
+    """
+
+
+def _current_thread_id() -> str:
+    try:
+        return session_id_from_config(get_config())
+    except RuntimeError:
+        return session_id_from_config(None)
+
+
+def cancel_thread(thread_id: str) -> int:
+    """通知该对话中正在执行的工具尽快停止，返回收到通知的工具调用数。"""
+    with _active_lock:
+        events = list(_active_calls.get(thread_id, ()))
+    for event in events:
+        event.set()
+    return len(events)
+
+
+def is_cancelled() -> bool:
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+
+def check_cancelled():
+    """在工具的检查点调用，已取消时抛出 ToolCancelled 以中止后续工作。"""
+    if is_cancelled():
+        raise ToolCancelled()
+
+
+def cancellable(tool_obj):
+    """
+    为工具启用协作式取消，需放在 @tool 之上。
+    同步执行时登记取消标记，ToolCancelled 转换为取消提示返回；
+    异步执行时（LangGraph 服务），运行任务被取消后通知工具线程在下一个检查点退出，
+    否则客户端断开后工具仍会在线程池中运行到结束。
+    """
+    func = tool_obj.func
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        thread_id = _current_thread_id()
+        event = threading.Event()
+        token = _cancel_event.set(event)
+        with _active_lock:
+            _active_calls.setdefault(thread_id, set()).add(event)
+        try:
+            return func(*args, **kwargs)
+        except ToolCancelled:
+            return f"⏹️ 已取消：{tool_obj.name} 的执行已被中止（客户端断开连接或运行超时）。"
+        finally:
+            with _active_lock:
+                calls = _active_calls.get(thread_id)
+                if calls is not None:
+                    calls.discard(event)
+                    if not calls:
+                        del _active_calls[thread_id]
+            _cancel_event.reset(token)
+
+    @functools.wraps(func)
+    async def arun(*args, **kwargs):
+        thread_id = _current_thread_id()
+        context = contextvars.copy_context()
+        future = asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(context.run, run, *args, **kwargs))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            cancel_thread(thread_id)
+            raise
+
+    tool_obj.func = run
+    tool_obj.coroutine = arun
+    return tool_obj
+
+
+class ProgressReporter:
+    """
+    通过 LangGraph 自定义流（stream_mode="custom"）发送工具进度事件。
+    事件按最小间隔节流，不在图运行上下文中（例如直接调用工具）时静默忽略。
+    每次报告前都会检查取消标记，因此报告点同时也是取消检查点。
+    """
+
+    def __init__(self, tool: str, min_interval: float = 0.5):
+        self.tool = tool
+        self.min_interval = min_interval
+        self.started = time.perf_counter()
+        self._last_sent = 0.0
+        try:
+            self._writer = get_stream_writer()
+        except (RuntimeError, KeyError):
+            # 不在运行上下文中，或在图外直接 invoke 工具（有运行配置但没有图运行时）
+            self._writer = None
+
+    def update(self, phase: str, message: str, force: bool = False, **fields):
+        check_cancelled()
+        now = time.perf_counter()
+        if self._writer is None or (not force and now - self._last_sent < self.min_interval):
+            return
+        self._last_sent = now
+        self._writer({
+            "type": PROGRESS_EVENT_TYPE,
+            "tool": self.tool,
+            "phase": phase,
+            "message": message,
+            "elapsed": round(now - self.started, 2),
+            **fields,
+        })
+
+    def done(self, message: str, **fields):
+        if self._writer is not None:
+            self.update("done", message, force=True, **fields)
+
+    def heartbeat(self, phase: str, message: str, interval: float = 2.0) -> "_Heartbeat":
+        """
+        用于无法分段执行的阻塞调用（如 pd.read_excel）：
+        在 with 块执行期间定期发送带已用时间的进度事件，避免前端长时间没有任何反馈。
+        """
+        return _Heartbeat(self, phase, message, interval)
+
+
+class _Heartbeat:
+    def __init__(self, reporter: ProgressReporter, phase: str, message: str, interval: float):
+        self.reporter = reporter
+        self.phase = phase
+        self.message = message
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _beat(self):
+        while not self._stop.wait(self.interval):
+            elapsed = time.perf_counter() - self.reporter.started
+            try:
+                self.reporter.update(self.phase, f"{self.message}（已用时 {elapsed:.0f} 秒）", force=True)
+            except ToolCancelled:
+                return
+
+    def __enter__(self):
+        self.reporter.update(self.phase, self.message, force=True)
+        if self.reporter._writer is not None:
+            context = contextvars.copy_context()
+            self._thread = threading.Thread(target=context.run, args=(self._beat,), daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return False
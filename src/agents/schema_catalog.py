@@ -0,0 +1,135 @@
+import os
+import re
+import time
+import threading
+from typing import Dict, List, Optional
+from src.agents.db import get_connection
+
+# 会改变表结构的语句，执行后需要使缓存失效
+_DDL_RE = re.compile(r"^\s*(CREATE|ALTER|DROP|RENAME|TRUNCATE)\b", re.IGNORECASE)
+
+
+class SchemaCatalog:
+    """
+    数据库结构目录：一次性从 information_schema 读取表、列、类型、索引和近似行数，
+    按TTL缓存，并渲染为紧凑文本供提示词和工具使用，避免反复执行 SHOW TABLES / DESCRIBE。
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_chars: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("SCHEMA_CACHE_TTL", "600"))
+        self.max_chars = max_chars if max_chars is not None else int(os.getenv("SCHEMA_PROMPT_MAX_CHARS", "4000"))
+        self._tables: Dict[str, dict] = {}
+        self._loaded_at = 0.0
+        self._error = ""
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """使缓存失效，下次访问时重新读取。"""
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def _introspect(self) -> Dict[str, dict]:
+        connection = get_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT TABLE_NAME, TABLE_ROWS, TABLE_COMMENT FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME"
+                )
+                tables = {
+                    name: {"rows": rows, "comment": comment or "", "columns": [], "indexes": {}}
+                    for name, rows, comment in cursor.fetchall()
+                }
+                cursor.execute(
+                    "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_COMMENT "
+                    "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() "
+                    "ORDER BY TABLE_NAME, ORDINAL_POSITION"
+                )
+                for table, column, column_type, nullable, key, comment in cursor.fetchall():
+                    if table in tables:
+                        tables[table]["columns"].append({
+                            "name": column, "type": column_type, "nullable": nullable == "YES",
+                            "key": key or "", "comment": comment or "",
+                        })
+                cursor.execute(
+                    "SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM information_schema.STATISTICS "
+                    "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX"
+                )
+                for table, index, non_unique, column in cursor.fetchall():
+                    if table in tables:
+                        entry = tables[table]["indexes"].setdefault(index, {"unique": not non_unique, "columns": []})
+                        entry["columns"].append(column)
+        finally:
+            connection.close()
+        return tables
+
+    def get(self, refresh: bool = False) -> Dict[str, dict]:
+        """返回缓存的表结构；过期或 refresh=True 时重新读取。读取失败时在一个TTL内不再重试。"""
+        with self._lock:
+            if refresh or time.time() - self._loaded_at > self.ttl:
+                try:
+                    self._tables = self._introspect()
+                    self._error = ""
+                except Exception as e:
+                    self._error = str(e)
+                self._loaded_at = time.time()
+            return self._tables
+
+    @property
+    def error(self) -> str:
+        return self._error
+
+    def render(self, tables: Optional[List[str]] = None, max_chars: Optional[int] = None) -> str:
+        """
+        将表结构渲染为紧凑文本，每张表一行，例如：
+        orders(~12000行): id bigint PK, region varchar(32) NULL, amount decimal(10,2) | 索引 idx_region(region)
+        """
+        catalog = self.get()
+        max_chars = max_chars if max_chars is not None else self.max_chars
+        names = [t for t in (tables or catalog.keys()) if t in catalog]
+        lines = []
+        total = 0
+        for name in names:
+            info = catalog[name]
+            columns = []
+            for col in info["columns"]:
+                item = f"{col['name']} {col['type']}"
+                if col["key"] == "PRI":
+                    item += " PK"
+                elif col["nullable"]:
+                    item += " NULL"
+                if col["comment"]:
+                    item += f"「{col['comment']}」"
+                columns.append(item)
+            line = f"{name}(~{info['rows'] or 0}行)"
+            if info["comment"]:
+                line += f"「{info['comment']}」"
+            line += ": " + ", ".join(columns)
+            indexes = [
+                f"{'uniq ' if idx['unique'] else ''}{idx_name}({','.join(idx['columns'])})"
+                for idx_name, idx in info["indexes"].items() if idx_name != "PRIMARY"
+            ]
+            if indexes:
+                line += " | 索引 " + "; ".join(indexes)
+            if max_chars and total + len(line) > max_chars:
+                lines.append(f"...（还有{len(names) - len(lines)}张表未列出，可通过 schema_info 工具查看）")
+                break
+            lines.append(line)
+            total += len(line) + 1
+        return "\n".join(lines)
+
+    def prompt_section(self) -> str:
+        """生成提示词中的数据库结构段落；数据库不可用时返回空字符串。"""
+        rendered = self.render()
+        if not rendered:
+            return ""
+        return f"\n**当前数据库结构（已缓存，无需再执行 SHOW TABLES / DESCRIBE）：**\n{rendered}\n"
+
+    def invalidate_if_ddl(self, sql_query: str):
+        """若SQL会改变表结构，则使缓存失效。"""
+        if _DDL_RE.match(sql_query):
+            self.invalidate()
+
+
+# 全局共享的结构目录
+schema_catalog = SchemaCatalog()
@@ -0,0 +1,425 @@
+import os
+import re
+import sys
+import json
+import time
+import types
+import atexit
+import pickle
+import shutil
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow 为可选依赖，缺失时以 pickle 落盘
+    feather = None
+
+DEFAULT_SESSION = "default"
+_UNNAMED_SERIES = "__series__"
+
+
+def session_id_from_config(config: Optional[dict]) -> str:
+    """从 LangGraph 运行配置中取出 thread_id 作为会话ID，未提供时使用默认会话。"""
+    configurable = (config or {}).get("configurable") or {}
+    return str(configurable.get("thread_id") or DEFAULT_SESSION)
+
+
+def code_names(code) -> set:
+    """收集一段代码（含嵌套函数、推导式）中引用的全部名称。"""
+    names = set(code.co_names) | set(code.co_varnames)
+    for const in code.co_consts:
+        if hasattr(const, "co_names"):
+            names |= code_names(const)
+    return names
+
+
+class _Session:
+    def __init__(self, namespace: dict):
+        self.namespace = namespace
+        self.base_keys = set(namespace.keys())
+        self.seeded = bool(namespace)
+        # 正在使用变量空间的工具调用数，大于0时不释放该会话的变量
+        self.active = 0
+        self.manifest: Dict[str, dict] = {}
+        self.spilled = set()
+        self.last_used = time.time()
+        self.lock = threading.RLock()
+
+
+def _content_hash(value) -> Optional[str]:
+    """变量内容的哈希，用于判断落盘副本是否仍与内存中的值一致；无法计算时返回 None。"""
+    digest = hashlib.sha256()
+    try:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+            if isinstance(value, pd.DataFrame):
+                digest.update(repr(list(zip(value.columns.astype(str), value.dtypes.astype(str)))).encode("utf-8"))
+            else:
+                digest.update(repr((value.name, str(value.dtype))).encode("utf-8"))
+        elif isinstance(value, np.ndarray) and value.dtype != object:
+            digest.update(repr((value.shape, str(value.dtype))).encode("utf-8"))
+            digest.update(np.ascontiguousarray(value).view(np.uint8).reshape(-1).data)
+        else:
+            digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return None
+    return digest.hexdigest()
+
+
+class SessionStore:
+    """
+    会话变量存储：每个对话线程（thread_id）拥有独立的变量空间，新建时以模块全局变量为初始内容。
+    当会话空闲超过 SESSION_IDLE_SECONDS 或进程内会话数据超过 SESSION_MEMORY_LIMIT_MB 时，
+    按最近最少使用顺序将用户变量写入本地目录并从内存释放：DataFrame/Series 使用 Arrow IPC
+    （无 pyarrow 时为 pickle），数值数组使用 .npy，其余可序列化对象使用 pickle；下次访问时再以内存映射方式加载。
+    写入前比较内容哈希，未变化的变量不重复写入；原地修改（如 df['x'] = ...）会在下次释放时写入。
+    每个会话的 manifest.json 记录变量与文件的对应关系，进程重启后可据此恢复；进程正常退出时会写入全部未落盘的变量。
+    空闲会话释放后，无法序列化的对象（函数、模块等）不会保留；超过 SESSION_RETENTION_SECONDS 未使用的会话目录会被删除。
+    """
+
+    def __init__(self, base_dir: Optional[str] = None, memory_limit_mb: Optional[float] = None,
+                 idle_seconds: Optional[float] = None, retention_seconds: Optional[float] = None):
+        self.base_dir = base_dir or os.getenv("SESSION_STORE_DIR", os.path.join(os.getcwd(), ".session_store"))
+        self.memory_limit = float(memory_limit_mb if memory_limit_mb is not None
+                                  else os.getenv("SESSION_MEMORY_LIMIT_MB", "2048")) * 1024 * 1024
+        self.idle_seconds = float(idle_seconds if idle_seconds is not None
+                                  else os.getenv("SESSION_IDLE_SECONDS", "1800"))
+        self.retention_seconds = float(retention_seconds if retention_seconds is not None
+                                       else os.getenv("SESSION_RETENTION_SECONDS", str(7 * 24 * 3600)))
+        self._sessions: Dict[str, _Session] = {}
+        self._default_base: Optional[dict] = None
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+
+    # ---------- 会话与变量空间 ----------
+    def set_default_base(self, base: dict):
+        """设置新建会话的初始变量空间（通常为工具模块的全局变量），无论由哪个调用方首先创建会话。"""
+        self._default_base = base
+
+    def _session_dir(self, session_id: str) -> str:
+        safe_id = re.sub(r"[^\w.-]", "_", session_id)
+        return os.path.join(self.base_dir, safe_id)
+
+    def _session(self, session_id: str, base: Optional[dict] = None) -> _Session:
+        base = base if base is not None else self._default_base
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = _Session(dict(base or {}))
+                manifest_path = os.path.join(self._session_dir(session_id), "manifest.json")
+                if os.path.exists(manifest_path):
+                    # 进程重启后恢复：变量保持落盘状态，按需加载
+                    try:
+                        with open(manifest_path, "r", encoding="utf-8") as f:
+                            session.manifest = json.load(f)
+                        session.spilled = set(session.manifest)
+                    except Exception:
+                        session.manifest = {}
+                self._sessions[session_id] = session
+            elif not session.seeded and base:
+                # 会话先于初始变量空间被创建时（例如由 pre_model_hook 创建），补充初始内容
+                with session.lock:
+                    for key, value in base.items():
+                        if key not in session.namespace and key not in session.spilled:
+                            session.namespace[key] = value
+                            session.base_keys.add(key)
+                    session.seeded = True
+            session.last_used = time.time()
+            return session
+
+    def namespace(self, session_id: str, base: Optional[dict] = None, code=None) -> dict:
+        """
+        返回会话的变量空间（首次访问时以 base 或默认初始变量空间创建）。
+        若提供已编译的代码对象，会预先加载其中引用到的已落盘变量。
+        """
+        session = self._session(session_id, base)
+        if code is not None:
+            self.ensure_loaded(session_id, code_names(code))
+        return session.namespace
+
+    @contextmanager
+    def use(self, session_id: str, base: Optional[dict] = None, code=None):
+        """
+        在工具执行代码期间使用会话变量空间：期间该会话不会被空闲释放或内存回收，
+        避免其他会话触发的回收从正在执行的代码中移走变量。
+        """
+        session = self._session(session_id, base)
+        with session.lock:
+            session.active += 1
+        try:
+            if code is not None:
+                self.ensure_loaded(session_id, code_names(code))
+            yield session.namespace
+        finally:
+            with session.lock:
+                session.active -= 1
+                session.last_used = time.time()
+
+    def ensure_loaded(self, session_id: str, names: Iterable[str]):
+        """将指定的已落盘变量重新加载到内存。"""
+        session = self._session(session_id)
+        with session.lock:
+            for name in set(names) & session.spilled:
+                entry = session.manifest[name]
+                value = self._load(entry)
+                session.namespace[name] = value
+                session.spilled.discard(name)
+                entry["nbytes"] = self._nbytes(value)
+
+    def get(self, session_id: str, name: str, default=None):
+        self.ensure_loaded(session_id, [name])
+        return self._session(session_id).namespace.get(name, default)
+
+    def user_variables(self, session_id: str, names: Iterable[str]) -> dict:
+        """返回指定名称中由用户创建的会话变量（不含初始的模块全局变量）。"""
+        session = self._session(session_id)
+        self.ensure_loaded(session_id, names)
+        with session.lock:
+            return {name: session.namespace[name] for name in names
+                    if name in session.namespace and name not in session.base_keys}
+
+    def set(self, session_id: str, name: str, value, base: Optional[dict] = None):
+        """保存变量（暂不落盘），随后执行内存回收。"""
+        session = self._session(session_id, base)
+        with session.lock:
+            session.namespace[name] = value
+            session.spilled.discard(name)
+            session.base_keys.discard(name)
+        self.enforce_limits()
+
+    def commit(self, session_id: str, names: Optional[Iterable[str]] = None):
+        """
+        工具执行结束后调用：清理已被删除变量的落盘文件，并执行内存回收。
+        :param names: 本次执行涉及的变量名（保留参数，变化检测基于内容哈希，不依赖此列表）
+        """
+        session = self._session(session_id)
+        with session.lock:
+            self._drop_deleted(session_id, session)
+        self.enforce_limits()
+
+    def _user_names(self, session: _Session) -> list:
+        return [name for name in session.namespace if name not in session.base_keys and not name.startswith("__")]
+
+    # ---------- 落盘与加载 ----------
+    @staticmethod
+    def _nbytes(value) -> int:
+        """变量占用内存的估计：数据对象按缓冲区大小，其他对象按浅层大小。"""
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            usage = value.memory_usage(index=True, deep=False)
+            return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+        if isinstance(value, np.ndarray):
+            return int(value.nbytes)
+        try:
+            return sys.getsizeof(value)
+        except TypeError:
+            return 0
+
+    @staticmethod
+    def _spillable(value) -> bool:
+        return not isinstance(value, (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type))
+
+    def _persist(self, session_id: str, session: _Session, names: Iterable[str]) -> set:
+        """将变量写入磁盘（内容未变化的跳过），返回磁盘副本与内存一致的变量名。"""
+        persisted = set()
+        changed = False
+        for name in names:
+            value = session.namespace.get(name)
+            if value is None or not self._spillable(value):
+                continue
+            content_hash = _content_hash(value)
+            if content_hash is None:
+                continue
+            entry = session.manifest.get(name)
+            if entry is None or entry.get("hash") != content_hash:
+                try:
+                    entry = self._dump(session_id, name, value)
+                except Exception:
+                    continue  # 无法序列化的对象保留在内存中
+                entry["hash"] = content_hash
+                session.manifest[name] = entry
+                changed = True
+            persisted.add(name)
+        if changed:
+            self._write_manifest(session_id, session)
+        return persisted
+
+    def _dump(self, session_id: str, name: str, value) -> dict:
+        session_dir = self._session_dir(session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            kind = "Series" if isinstance(value, pd.Series) else "DataFrame"
+        elif isinstance(value, np.ndarray):
+            kind = "ndarray"
+        else:
+            kind = "object"
+        entry = {"kind": kind, "shape": list(getattr(value, "shape", ())), "saved_at": time.time(),
+                 "nbytes": self._nbytes(value)}
+
+        # 先写临时文件再替换，已按内存映射加载的旧文件不受影响
+        def write(path, writer):
+            tmp_path = path + ".tmp"
+            writer(tmp_path)
+            os.replace(tmp_path, path)
+            return path
+
+        if kind in ("DataFrame", "Series"):
+            frame = value.to_frame(name=_UNNAMED_SERIES if value.name is None else value.name) if kind == "Series" else value
+            if feather is not None:
+                try:
+                    # 不压缩，以便重新加载时使用内存映射
+                    path = write(os.path.join(session_dir, f"{safe_name}.arrow"),
+                                 lambda p: feather.write_feather(frame, p, compression="uncompressed"))
+                    entry.update(path=path, format="arrow")
+                    return entry
+                except Exception:
+                    pass  # 非字符串列名、混合类型对象列等情况退回 pickle
+            path = write(os.path.join(session_dir, f"{safe_name}.pkl"), value.to_pickle)
+            entry.update(path=path, format="pickle")
+        elif kind == "ndarray" and value.dtype != object:
+            def save_npy(p):
+                with open(p, "wb") as f:
+                    np.save(f, value, allow_pickle=False)
+            path = write(os.path.join(session_dir, f"{safe_name}.npy"), save_npy)
+            entry.update(path=path, format="npy")
+        else:
+            def save_pickle(p):
+                with open(p, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            path = write(os.path.join(session_dir, f"{safe_name}.pkl"), save_pickle)
+            entry.update(path=path, format="pickle")
+        return entry
+
+    def _load(self, entry: dict):
+        if entry["format"] == "arrow":
+            value = feather.read_table(entry["path"], memory_map=True).to_pandas()
+            if entry["kind"] != "Series":
+                return value
+            series = value.iloc[:, 0]
+            return series.rename(None) if series.name == _UNNAMED_SERIES else series
+        if entry["format"] == "npy":
+            # 写时复制映射：可原地修改，修改不会写回文件
+            return np.load(entry["path"], mmap_mode="c", allow_pickle=False)
+        if entry["kind"] in ("DataFrame", "Series"):
+            return pd.read_pickle(entry["path"])
+        with open(entry["path"], "rb") as f:
+            return pickle.load(f)
+
+    def _write_manifest(self, session_id: str, session: _Session):
+        path = os.path.join(self._session_dir(session_id), "manifest.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session.manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _drop_deleted(self, session_id: str, session: _Session):
+        """用户已删除（del）的变量，同时删除其落盘文件，避免恢复时重新出现。"""
+        deleted = [name for name in session.manifest
+                   if name not in session.spilled and name not in session.namespace]
+        for name in deleted:
+            try:
+                os.remove(session.manifest.pop(name)["path"])
+            except OSError:
+                pass
+        if deleted:
+            self._write_manifest(session_id, session)
+
+    # ---------- 内存回收 ----------
+    def _spill(self, session_id: str, session: _Session) -> int:
+        """将会话中的用户变量写入磁盘（仅写入有变化的）并从内存释放，返回释放的字节数估计。"""
+        freed = 0
+        with session.lock:
+            if session.active:
+                return 0
+            self._drop_deleted(session_id, session)
+            for name in self._persist(session_id, session, self._user_names(session)):
+                freed += self._nbytes(session.namespace.pop(name))
+                session.spilled.add(name)
+        return freed
+
+    def flush(self):
+        """将所有会话中有变化的变量写入磁盘但不释放内存，用于进程退出前保存。"""
+        with self._lock:
+            sessions = list(self._sessions.items())
+        for session_id, session in sessions:
+            with session.lock:
+                self._drop_deleted(session_id, session)
+                self._persist(session_id, session, self._user_names(session))
+
+    def memory_usage(self) -> int:
+        """估算所有会话中驻留内存的用户变量大小（字节）。"""
+        total = 0
+        for session in list(self._sessions.values()):
+            with session.lock:
+                total += sum(self._nbytes(session.namespace[name]) for name in self._user_names(session))
+        return total
+
+    def enforce_limits(self):
+        """
+        释放并移除空闲会话；若仍超出内存上限，按最近最少使用顺序继续释放；
+        定期删除超过保留期限的会话目录。
+        """
+        now = time.time()
+        with self._lock:
+            sessions = sorted(self._sessions.items(), key=lambda item: item[1].last_used)
+        for session_id, session in sessions:
+            if now - session.last_used > self.idle_seconds:
+                self._spill(session_id, session)
+                with self._lock:
+                    if (self._sessions.get(session_id) is session and not session.active
+                            and now - session.last_used > self.idle_seconds):
+                        del self._sessions[session_id]
+        usage = self.memory_usage()
+        for session_id, session in sessions:
+            if usage <= self.memory_limit:
+                break
+            usage -= self._spill(session_id, session)
+        if now - self._last_cleanup > min(self.retention_seconds, 3600):
+            self._last_cleanup = now
+            self._remove_expired(now)
+
+    def _remove_expired(self, now: float):
+        try:
+            entries = list(os.scandir(self.base_dir))
+        except OSError:
+            return
+        with self._lock:
+            active = {self._session_dir(session_id) for session_id in self._sessions}
+        for entry in entries:
+            if not entry.is_dir() or entry.path in active:
+                continue
+            try:
+                if now - entry.stat().st_mtime > self.retention_seconds:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                continue
+
+    # ---------- 与图状态的对接 ----------
+    def references(self, session_id: str) -> Dict[str, dict]:
+        """返回会话中已落盘变量的引用，写入检查点中的图状态。"""
+        session = self._session(session_id)
+        with session.lock:
+            return {name: {k: entry[k] for k in ("path", "format", "kind", "shape")}
+                    for name, entry in session.manifest.items()}
+
+    def restore(self, session_id: str, references: Optional[Dict[str, dict]]):
+        """根据检查点中的引用补全会话清单（例如本地 manifest 丢失但数据文件仍在）。"""
+        if not references:
+            return
+        session = self._session(session_id)
+        with session.lock:
+            for name, ref in references.items():
+                if name not in session.manifest and name not in session.namespace and os.path.exists(ref.get("path", "")):
+                    session.manifest[name] = {**ref, "nbytes": 0, "saved_at": os.path.getmtime(ref["path"])}
+                    session.spilled.add(name)
+
+
+# 全局共享的会话存储；进程正常退出时写入未落盘的变量
+session_store = SessionStore()
+atexit.register(session_store.flush)
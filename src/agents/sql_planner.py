@@ -0,0 +1,289 @@
+import os
+import re
+from typing import Any, List, Optional, Union
+from pydantic import BaseModel, Field
+
+# 标识符白名单：字母、数字、下划线、中文，可带一级库名前缀
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z0-9_\u4e00-\u9fff]+(\.[A-Za-z0-9_\u4e00-\u9fff]+)?$")
+_AGGREGATE_RE = re.compile(r"\bGROUP\s+BY\b|\bDISTINCT\b|\b(COUNT|SUM|AVG|MIN|MAX)\s*\(", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"\bLIMIT\s+(\d+)(?:\s*(,|OFFSET)\s*(\d+))?\s*;?\s*$", re.IGNORECASE)
+# 字符串与反引号标识符原样保留（第1组），其余匹配为注释；/*! */ 与优化器提示 /*+ */ 会被执行，不视为注释
+_SQL_COMMENT_RE = re.compile(
+    r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`[^`]*`)|/\*(?![!+]).*?\*/|--(?=\s|$)[^\n]*|#[^\n]*",
+    re.DOTALL,
+)
+
+FILTER_OPS = {
+    "=": "=", "!=": "<>", "<>": "<>", ">": ">", ">=": ">=", "<": "<", "<=": "<=",
+    "like": "LIKE", "not like": "NOT LIKE", "in": "IN", "not in": "NOT IN",
+    "between": "BETWEEN", "is null": "IS NULL", "is not null": "IS NOT NULL",
+}
+AGG_FUNCS = {
+    "count": "COUNT({})", "sum": "SUM({})", "avg": "AVG({})", "min": "MIN({})",
+    "max": "MAX({})", "count_distinct": "COUNT(DISTINCT {})",
+}
+
+
+class FilterSpec(BaseModel):
+    column: str = Field(description="过滤列名")
+    op: str = Field(description="比较运算符：=, !=, >, >=, <, <=, like, not like, in, not in, between, is null, is not null", default="=")
+    value: Any = Field(description="比较值；in/not in 传列表，between 传两个元素的列表，is null 可省略", default=None)
+
+
+class AggregateSpec(BaseModel):
+    func: str = Field(description="聚合函数：count, sum, avg, min, max, count_distinct")
+    column: str = Field(description="聚合列名，count 可使用 '*'", default="*")
+    alias: str = Field(description="结果列别名（可选）", default="")
+
+
+class ExtractSpec(BaseModel):
+    table: str = Field(description="数据表名")
+    columns: List[str] = Field(description="需要提取的列，为空且无聚合时提取全部列", default=[])
+    filters: List[FilterSpec] = Field(description="过滤条件，多个条件之间为 AND 关系", default=[])
+    group_by: List[str] = Field(description="分组列", default=[])
+    aggregates: List[AggregateSpec] = Field(description="聚合计算", default=[])
+    order_by: List[str] = Field(description="排序列，列名前加 '-' 表示降序，可使用聚合别名", default=[])
+    sample_fraction: Optional[float] = Field(description="服务端随机抽样比例（0-1，可选）", default=None)
+    limit: Optional[int] = Field(description="最大返回行数（可选）", default=None)
+
+
+def quote_identifier(name: str) -> str:
+    """校验并用反引号包裹标识符，防止SQL注入。"""
+    name = name.strip()
+    if not _IDENTIFIER_RE.match(name):
+        raise ValueError(f"非法的标识符：{name}")
+    return ".".join(f"`{part}`" for part in name.split("."))
+
+
+def _agg_alias(agg: AggregateSpec) -> str:
+    if agg.alias:
+        return agg.alias
+    column = "all" if agg.column.strip() == "*" else agg.column.strip()
+    return f"{agg.func.lower()}_{column}"
+
+
+def _compile_filter(flt: FilterSpec, params: list) -> str:
+    op = flt.op.strip().lower()
+    if op not in FILTER_OPS:
+        raise ValueError(f"不支持的过滤运算符：{flt.op}")
+    column = quote_identifier(flt.column)
+    sql_op = FILTER_OPS[op]
+    if op in ("is null", "is not null"):
+        return f"{column} {sql_op}"
+    if op in ("in", "not in"):
+        values = list(flt.value) if isinstance(flt.value, (list, tuple)) else [flt.value]
+        if not values:
+            raise ValueError(f"{flt.op} 运算符的取值列表不能为空")
+        params.extend(values)
+        return f"{column} {sql_op} ({', '.join(['%s'] * len(values))})"
+    if op == "between":
+        if not isinstance(flt.value, (list, tuple)) or len(flt.value) != 2:
+            raise ValueError("between 运算符需要两个元素的列表")
+        params.extend(flt.value)
+        return f"{column} BETWEEN %s AND %s"
+    params.append(flt.value)
+    return f"{column} {sql_op} %s"
+
+
+def compile_spec(spec: ExtractSpec) -> tuple:
+    """
+    将声明式提取规格编译为参数化SQL。
+    :return: (sql, params)，params 可直接传给 cursor.execute / pd.read_sql
+    """
+    params: list = []
+    select_items = [quote_identifier(c) for c in spec.columns]
+    for agg in spec.aggregates:
+        func = agg.func.strip().lower()
+        if func not in AGG_FUNCS:
+            raise ValueError(f"不支持的聚合函数：{agg.func}")
+        column = "*" if agg.column.strip() == "*" else quote_identifier(agg.column)
+        if column == "*" and func != "count":
+            raise ValueError(f"{agg.func} 聚合必须指定列名")
+        alias = _agg_alias(agg)
+        select_items.append(f"{AGG_FUNCS[func].format(column)} AS {quote_identifier(alias)}")
+    # 分组列若未显式选择，则自动加入结果
+    missing_groups = [quote_identifier(c) for c in spec.group_by if c not in spec.columns]
+    select_items = missing_groups + select_items
+    if not select_items:
+        select_items = ["*"]
+
+    sql = f"SELECT {', '.join(select_items)} FROM {quote_identifier(spec.table)}"
+
+    conditions = [_compile_filter(f, params) for f in spec.filters]
+    if spec.sample_fraction is not None:
+        if not 0 < spec.sample_fraction <= 1:
+            raise ValueError("sample_fraction 必须在 (0, 1] 区间内")
+        if spec.sample_fraction < 1:
+            conditions.append("RAND() < %s")
+            params.append(spec.sample_fraction)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if spec.group_by:
+        sql += " GROUP BY " + ", ".join(quote_identifier(c) for c in spec.group_by)
+    if spec.order_by:
+        order_items = []
+        for item in spec.order_by:
+            desc = item.startswith("-")
+            name = item.lstrip("-")
+            order_items.append(f"{quote_identifier(name)}{' DESC' if desc else ''}")
+        sql += " ORDER BY " + ", ".join(order_items)
+    if spec.limit is not None:
+        if spec.limit <= 0:
+            raise ValueError("limit 必须为正整数")
+        sql += " LIMIT %s"
+        params.append(int(spec.limit))
+    return sql, params
+
+
+def explain_rows(connection, sql: str, params: Optional[list] = None) -> Optional[int]:
+    """
+    使用 EXPLAIN 估算查询需要扫描的行数（rows × filtered%）。
+    同一 select id 内的表按嵌套循环相乘，不同 select id 取最大值；无法估算时返回 None。
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN " + sql.strip().rstrip(";"), params or None)
+            columns = [d[0].lower() for d in cursor.description]
+            plan = cursor.fetchall()
+    except Exception:
+        return None
+    if "rows" not in columns:
+        return None
+    rows_idx = columns.index("rows")
+    filtered_idx = columns.index("filtered") if "filtered" in columns else None
+    id_idx = columns.index("id") if "id" in columns else None
+
+    per_select = {}
+    for row in plan:
+        if row[rows_idx] is None:
+            continue
+        estimate = float(row[rows_idx])
+        if filtered_idx is not None and row[filtered_idx] is not None:
+            estimate *= float(row[filtered_idx]) / 100
+        key = row[id_idx] if id_idx is not None else 0
+        per_select[key] = per_select.get(key, 1.0) * max(estimate, 1.0)
+    if not per_select:
+        return None
+    return int(max(per_select.values()))
+
+
+def estimate_transfer_rows(connection, spec_or_sql: Union[ExtractSpec, str]) -> tuple:
+    """
+    估算查询结果需要传输到客户端的行数。
+    :return: (估算行数或None, 是否为上界估计)
+    """
+    if isinstance(spec_or_sql, ExtractSpec):
+        spec = spec_or_sql
+        if spec.aggregates and not spec.group_by:
+            return 1, False
+        # 抽样与LIMIT不计入EXPLAIN，单独在客户端折算，避免重复估计
+        base_sql, base_params = compile_spec(spec.model_copy(update={"sample_fraction": None, "limit": None}))
+        rows = explain_rows(connection, base_sql, base_params)
+        if rows is None:
+            return spec.limit, spec.limit is not None
+        if spec.sample_fraction is not None:
+            rows = int(rows * spec.sample_fraction)
+        if spec.limit is not None:
+            rows = min(rows, spec.limit)
+        return rows, bool(spec.group_by)
+
+    sql = spec_or_sql
+    limit_match = _LIMIT_RE.search(sql)
+    limit = None
+    if limit_match:
+        # LIMIT offset, count 与 LIMIT count OFFSET offset 两种写法
+        limit = int(limit_match.group(3) if limit_match.group(2) == "," else limit_match.group(1))
+    rows = explain_rows(connection, sql)
+    if rows is None:
+        return limit, limit is not None
+    if limit is not None:
+        rows = min(rows, limit)
+    # 含聚合的语句，EXPLAIN给出的是扫描行数，仅能作为结果行数的上界
+    return rows, bool(_AGGREGATE_RE.search(sql))
+
+
+def get_guardrail_config() -> tuple:
+    """读取提取规模护栏配置：(最大传输行数, 超限策略 refuse/sample)。"""
+    max_rows = int(os.getenv("EXTRACT_MAX_ROWS", "500000"))
+    policy = os.getenv("EXTRACT_OVERSIZE_POLICY", "sample").strip().lower()
+    if policy not in ("refuse", "sample"):
+        policy = "refuse"
+    return max_rows, policy
+
+
+def strip_sql_comments(sql: str) -> str:
+    """去除SQL注释（保留字符串字面量），避免追加的 LIMIT 或包装的子查询被末尾的 -- / # 注释吞掉。"""
+    return _SQL_COMMENT_RE.sub(lambda m: m.group(1) or " ", sql)
+
+
+def cap_sql(sql: str, max_rows: int) -> str:
+    """为原始SQL加上服务端行数上限：已有的末尾 LIMIT 取较小值，否则追加 LIMIT。"""
+    match = _LIMIT_RE.search(sql)
+    if not match:
+        return f"{sql} LIMIT {max_rows}"
+    first, sep, second = match.group(1), match.group(2), match.group(3)
+    if sep == ",":
+        clause = f"LIMIT {first}, {min(int(second), max_rows)}"
+    elif sep:
+        clause = f"LIMIT {min(int(first), max_rows)} OFFSET {second}"
+    else:
+        clause = f"LIMIT {min(int(first), max_rows)}"
+    return sql[:match.start()] + clause
+
+
+def can_wrap_subquery(connection, sql: str) -> bool:
+    """
+    结果列名唯一时才能作为派生表包装；SELECT * 连接多表常出现重名列，包装后 MySQL 报 1060。
+    以 LIMIT 0 探测，不读取数据。
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT * FROM ({sql}) AS _guardrail_probe LIMIT 0")
+        return True
+    except Exception:
+        return False
+
+
+def apply_guardrail(spec_or_sql: Union[ExtractSpec, str], estimated_rows: Optional[int],
+                    is_upper_bound: bool, max_rows: int, policy: str, connection=None) -> tuple:
+    """
+    对超出规模上限的提取请求执行护栏策略。
+    聚合结果的估计仅为上界，且抽样会改变聚合值的含义，因此聚合查询不做抽样。
+    估计为上界或无法估计时，在服务端加 LIMIT max_rows + 1 上限，调用方读取后按 row_cap 截断并提示。
+    :param connection: 用于探测原始SQL能否包装为抽样子查询；不提供时视为可以包装
+    :return: (sql, params, 提示信息, row_cap)；若拒绝执行，sql 为 None；row_cap 为结果需截断到的行数，无需截断时为 None
+    """
+    if isinstance(spec_or_sql, ExtractSpec):
+        sql, params = compile_spec(spec_or_sql)
+    else:
+        sql, params = strip_sql_comments(spec_or_sql).strip().rstrip(";").rstrip(), []
+
+    if estimated_rows is not None and estimated_rows <= max_rows:
+        return sql, params, "", None
+
+    if estimated_rows is None or is_upper_bound:
+        if isinstance(spec_or_sql, ExtractSpec):
+            limit = min(spec_or_sql.limit, max_rows + 1) if spec_or_sql.limit else max_rows + 1
+            sql, params = compile_spec(spec_or_sql.model_copy(update={"limit": limit}))
+        else:
+            sql = cap_sql(sql, max_rows + 1)
+        return sql, params, "", max_rows
+
+    fraction = max_rows / estimated_rows
+    is_aggregate = isinstance(spec_or_sql, ExtractSpec) and bool(spec_or_sql.aggregates)
+    if policy == "sample" and not is_aggregate:
+        if isinstance(spec_or_sql, ExtractSpec):
+            current = spec_or_sql.sample_fraction or 1.0
+            sql, params = compile_spec(spec_or_sql.model_copy(update={"sample_fraction": current * fraction}))
+        elif connection is None or can_wrap_subquery(connection, sql):
+            # 原始SQL中的 % 需转义，避免与抽样参数占位符冲突
+            sql = f"SELECT * FROM ({sql.replace('%', '%%')}) AS _guardrail_sample WHERE RAND() < %s"
+            params = [fraction]
+        else:
+            return (cap_sql(sql, max_rows), params,
+                    f"⚠️ 预计传输约 {estimated_rows} 行，超过上限 {max_rows} 行；结果含重名列无法包装抽样，已只读取前 {max_rows} 行。\n",
+                    None)
+        return sql, params, f"⚠️ 预计传输约 {estimated_rows} 行，超过上限 {max_rows} 行，已在服务端按 {fraction:.4f} 比例随机抽样。\n", None
+
+    return None, None, (f"❌ 预计传输约 {estimated_rows} 行，超过上限 {max_rows} 行，已拒绝执行。"
+                        f"请通过 spec 指定所需列、过滤条件、分组聚合或 limit，在数据库端完成聚合后再提取。"), None
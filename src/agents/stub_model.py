@@ -0,0 +1,47 @@
+import time
+import uuid
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class StubChatModel(BaseChatModel):
+    """
+    离线基准测试用的本地模型，不调用任何外部服务。
+    按用户消息 additional_kwargs["stub_tool_calls"] 中的脚本依次发起工具调用
+    （每一项为一个调用或一组并行调用 {"name": ..., "args": {...}}），脚本执行完后返回汇总工具输出的最终回答。
+    """
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "StubChatModel":
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        human_positions = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        start = human_positions[-1] if human_positions else 0
+        human = messages[start] if human_positions else None
+        script = (human.additional_kwargs.get("stub_tool_calls") or []) if human else []
+        turn = messages[start + 1:]
+        steps_done = sum(1 for m in turn if isinstance(m, AIMessage) and m.tool_calls)
+
+        if steps_done < len(script):
+            step = script[steps_done]
+            calls = step if isinstance(step, list) else [step]
+            message = AIMessage(content="", tool_calls=[
+                {"name": call["name"], "args": call.get("args", {}), "id": f"stub_{uuid.uuid4().hex[:12]}"}
+                for call in calls
+            ])
+        else:
+            outputs = [str(m.content)[:500] for m in turn if isinstance(m, ToolMessage)]
+            question = human.content if human else ""
+            message = AIMessage(content="\n".join([f"[stub] {question}"] + outputs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
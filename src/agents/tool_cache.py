@@ -0,0 +1,322 @@
+import os
+import re
+import ast
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from typing import Iterable, Optional
+
+# 只读语句的起始关键字
+_READ_ONLY_START_RE = re.compile(r"^\s*(SELECT|WITH|SHOW|DESCRIBE|DESC|EXPLAIN)\b", re.IGNORECASE)
+# 出现即视为写操作或带锁读取
+_WRITE_RE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|REPLACE|CREATE|ALTER|DROP|TRUNCATE|RENAME|GRANT|REVOKE|LOCK|UNLOCK|CALL|SET|"
+    r"LOAD|HANDLER|MERGE|OUTFILE|DUMPFILE|SHARE\s+MODE)\b",
+    re.IGNORECASE,
+)
+# 结果随时间或调用变化的函数，不可缓存
+_NONDETERMINISTIC_RE = re.compile(
+    r"\b(RAND|NOW|UUID|UUID_SHORT|SYSDATE|CURDATE|CURTIME|UNIX_TIMESTAMP|UTC_DATE|UTC_TIME|UTC_TIMESTAMP|"
+    r"CONNECTION_ID|LAST_INSERT_ID|FOUND_ROWS|ROW_COUNT|SLEEP|USER)\s*\(|"
+    r"\b(CURRENT_DATE|CURRENT_TIME|CURRENT_TIMESTAMP|CURRENT_USER|LOCALTIME|LOCALTIMESTAMP)\b",
+    re.IGNORECASE,
+)
+_COMMENT_RE = re.compile(r"/\*.*?\*/|--[^\n]*|#[^\n]*", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_TABLE_RE = re.compile(r"\b(?:FROM|JOIN)\s+(`?[\w\u4e00-\u9fff]+`?(?:\.`?[\w\u4e00-\u9fff]+`?)?)", re.IGNORECASE)
+_COMMA_TABLES_RE = re.compile(
+    r"\bFROM\s+[`\w\u4e00-\u9fff.]+(?:\s+(?:AS\s+)?\w+)?((?:\s*,\s*[`\w\u4e00-\u9fff.]+(?:\s+(?:AS\s+)?\w+)?)+)",
+    re.IGNORECASE,
+)
+# 引用后会使图片结果不确定的名称
+_NONDETERMINISTIC_NAMES = {"random", "now", "today", "time", "uuid4", "input"}
+
+
+def _strip_sql(sql: str) -> str:
+    """去除注释与字符串字面量，便于关键字检测。"""
+    return _STRING_RE.sub("''", _COMMENT_RE.sub(" ", sql))
+
+
+def is_read_only_sql(sql: str) -> bool:
+    """判断SQL是否为单条只读语句（不含写操作、带锁读取或导出文件）。"""
+    stripped = _strip_sql(sql).strip().rstrip(";")
+    if ";" in stripped or not _READ_ONLY_START_RE.match(stripped):
+        return False
+    return not _WRITE_RE.search(stripped)
+
+
+def is_cacheable_sql(sql: str) -> bool:
+    """只读且结果确定（不含 RAND()/NOW() 等函数）的SQL才允许缓存。"""
+    return is_read_only_sql(sql) and not _NONDETERMINISTIC_RE.search(_strip_sql(sql))
+
+
+def referenced_tables(sql: str) -> list:
+    """提取SQL中 FROM / JOIN 引用的表名（去除反引号）。"""
+    stripped = _strip_sql(sql)
+    tables = [t.replace("`", "") for t in _TABLE_RE.findall(stripped)]
+    for group in _COMMA_TABLES_RE.findall(stripped):
+        for item in group.split(","):
+            item = item.strip()
+            if item:
+                tables.append(item.split()[0].replace("`", ""))
+    return sorted(set(tables))
+
+
+# 表版本在短时间内复用，避免每次工具调用都查询 information_schema
+_TABLE_VERSION_TTL = float(os.getenv("TOOL_CACHE_TABLE_VERSION_TTL", "5"))
+_table_versions: dict = {}
+_table_versions_lock = threading.Lock()
+
+
+def db_fingerprint(connection, tables: Iterable[str]) -> Optional[str]:
+    """
+    根据 information_schema 中的更新时间、行数和数据大小生成表的版本指纹，
+    每个表的版本在 TOOL_CACHE_TABLE_VERSION_TTL 秒内复用。
+    更新时间不可用的表（如重启后的 InnoDB 表）无法低成本确定版本，视为不可缓存，
+    不使用需要全表扫描的 CHECKSUM TABLE。
+    任一表无法确定版本时返回 None，表示不可缓存。
+    """
+    tables = sorted(set(tables))
+    if not tables or any(t.lower().startswith(("information_schema.", "performance_schema.", "mysql.", "sys."))
+                         for t in tables):
+        return None
+    try:
+        return _db_fingerprint(connection, tables)
+    except Exception:
+        return None
+
+
+def _db_fingerprint(connection, tables: list) -> Optional[str]:
+    database = getattr(connection, "db", None)
+    now = time.monotonic()
+    parts = {}
+    with _table_versions_lock:
+        for table in tables:
+            cached = _table_versions.get((database, table))
+            if cached is not None and now - cached[0] < _TABLE_VERSION_TTL:
+                if cached[1] is None:
+                    return None
+                parts[table] = cached[1]
+    missing = [t for t in tables if t not in parts]
+    if missing:
+        versions = _read_table_versions(connection, missing)
+        with _table_versions_lock:
+            for table, version in versions.items():
+                _table_versions[(database, table)] = (now, version)
+        if any(versions[t] is None for t in missing):
+            return None
+        parts.update(versions)
+    return hashlib.sha256("|".join(parts[t] for t in tables).encode("utf-8")).hexdigest()
+
+
+def _read_table_versions(connection, tables: list) -> dict:
+    """读取表的版本描述；视图、临时表、不存在或更新时间为空的表对应 None。"""
+    versions = {}
+    with connection.cursor() as cursor:
+        try:
+            # MySQL 8 默认缓存表统计信息一天，需读取最新值
+            cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+        except Exception:
+            pass
+        for table in tables:
+            schema_sql, name = ("%s", table.split(".", 1)[1]) if "." in table else ("DATABASE()", table)
+            params = [table.split(".", 1)[0], name] if "." in table else [name]
+            cursor.execute(
+                "SELECT UPDATE_TIME, TABLE_ROWS, DATA_LENGTH, CREATE_TIME FROM information_schema.TABLES "
+                f"WHERE TABLE_SCHEMA = {schema_sql} AND TABLE_NAME = %s AND TABLE_TYPE = 'BASE TABLE'",
+                params,
+            )
+            row = cursor.fetchone()
+            if row is None or row[0] is None:
+                versions[table] = None
+            else:
+                update_time, rows, data_length, create_time = row
+                versions[table] = f"{table}:{update_time}:{rows}:{data_length}:{create_time}"
+    return versions
+
+
+def file_fingerprint(path: str) -> str:
+    """文件大小、修改时间与开头1MB内容的哈希。"""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read(1024 * 1024))
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{digest.hexdigest()}"
+
+
+def frame_fingerprint(value) -> str:
+    """DataFrame/Series 内容哈希（向量化计算），与对象所在会话无关。"""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(list(zip(value.columns.astype(str), value.dtypes.astype(str)))).encode("utf-8"))
+    else:
+        digest.update(f"{value.name}:{value.dtype}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def variables_fingerprint(variables: dict) -> Optional[str]:
+    """
+    代码所引用会话变量的内容指纹；存在无法稳定描述的对象时返回 None。
+    """
+    parts = []
+    for name in sorted(variables):
+        value = variables[name]
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            try:
+                parts.append(f"{name}={frame_fingerprint(value)}")
+            except TypeError:  # 含不可哈希对象（如列表）的列
+                return None
+        elif isinstance(value, np.ndarray) and value.dtype != object:
+            digest = hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+            parts.append(f"{name}=ndarray:{value.dtype}:{value.shape}:{digest}")
+        elif value is None or isinstance(value, (bool, int, float, str)):
+            parts.append(f"{name}={value!r}")
+        elif isinstance(value, (list, tuple, dict)) and len(repr(value)) <= 10000:
+            parts.append(f"{name}={value!r}")
+        else:
+            return None
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def code_is_deterministic(names: Iterable[str]) -> bool:
+    return not (set(names) & _NONDETERMINISTIC_NAMES)
+
+
+def assigned_names(tree: ast.AST) -> set:
+    """
+    代码会写入会话的名称：赋值、删除、import、函数与类定义的目标，
+    以及下标/属性赋值与 inplace=True 调用所修改的变量。
+    """
+    names = set()
+
+    def base_name(node):
+        while isinstance(node, (ast.Subscript, ast.Attribute, ast.Starred)):
+            node = node.value
+        return node.id if isinstance(node, ast.Name) else None
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(base_name(node))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and any(
+                kw.arg == "inplace" and not (isinstance(kw.value, ast.Constant) and not kw.value.value)
+                for kw in node.keywords):
+            names.add(base_name(node.func.value))
+    names.discard(None)
+    return names
+
+
+class ToolResultCache:
+    """
+    跨对话共享的工具结果缓存（本地SQLite），键为：工具名 + 规范化参数 + 数据指纹。
+    可附带一个 pickle 序列化的载荷（如读取得到的 DataFrame），命中时无需重新解析文件或查询数据库。
+    总大小超过 TOOL_CACHE_MAX_MB 时按最近最少访问顺序淘汰。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_mb: Optional[float] = None, enabled: Optional[bool] = None):
+        self.path = path or os.getenv("TOOL_CACHE_PATH", os.path.join(os.getcwd(), ".tool_cache", "tool_cache.sqlite"))
+        self.max_bytes = int(float(max_mb if max_mb is not None else os.getenv("TOOL_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+        self.enabled = enabled if enabled is not None else os.getenv("TOOL_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            # WAL 模式允许多个进程（如开发服务与批处理）共享同一缓存
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache ("
+                "key TEXT PRIMARY KEY, tool TEXT, result TEXT, payload BLOB, size INTEGER, "
+                "created_at REAL, accessed_at REAL, hits INTEGER DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_cache_accessed ON tool_cache(accessed_at)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def warm_up(self):
+        """提前打开缓存数据库连接并建表。"""
+        if self.enabled:
+            with self._lock:
+                self._connection()
+
+    @staticmethod
+    def make_key(tool_name: str, args: dict, fingerprint: str) -> str:
+        canonical = json.dumps({"tool": tool_name, "args": args, "fingerprint": fingerprint},
+                               sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[tuple]:
+        """返回 (结果文本, 载荷对象或None)；未命中或缓存不可用时返回 None。"""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT result, payload FROM tool_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE tool_cache SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+                conn.commit()
+            return row[0], pickle.loads(row[1]) if row[1] is not None else None
+        except Exception:
+            return None
+
+    def put(self, key: str, tool_name: str, result: str, payload=None):
+        """写入缓存并执行淘汰；单条超过上限四分之一的结果不缓存。"""
+        if not self.enabled:
+            return
+        try:
+            limit = self.max_bytes // 4
+            # 先按内存占用估算大小，过大的 DataFrame 无需序列化即可跳过
+            if isinstance(payload, (pd.DataFrame, pd.Series)) and \
+                    int(np.sum(payload.memory_usage(index=True, deep=False))) > limit:
+                return
+            blob = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL) if payload is not None else None
+            size = len(result.encode("utf-8")) + (len(blob) if blob is not None else 0)
+            if size > limit:
+                return
+            now = time.time()
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO tool_cache (key, tool, result, payload, size, created_at, accessed_at, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                    (key, tool_name, result, blob, size, now, now),
+                )
+                self._evict(conn)
+                conn.commit()
+        except Exception:
+            pass  # 缓存失败不影响工具结果
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tool_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 淘汰到上限的90%，避免每次写入都触发淘汰
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM tool_cache ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        conn.executemany("DELETE FROM tool_cache WHERE key = ?", victims)
+
+
+# 全局共享的工具结果缓存
+tool_cache = ToolResultCache()